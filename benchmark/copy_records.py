@@ -0,0 +1,75 @@
+"""
+Compare shallow and deep record copies on fact-sized records:
+
+    python benchmark/copy_records.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "filter_plugins")
+)
+
+from custom_filters import alias_keys, drop_attributes, key_item  # noqa: E402
+
+
+def fact_record(packages=2000, interfaces=32, mounts=64):
+    return {
+        "inventory_hostname": "host01.example.com",
+        "ansible_host": "10.0.0.1",
+        "ansible_facts": {
+            "packages": {
+                "pkg{0}".format(i): [{"version": "1.{0}".format(i), "arch": "amd64"}]
+                for i in range(packages)
+            },
+            "interfaces": {
+                "eth{0}".format(i): {
+                    "ipv4": {
+                        "address": "10.0.{0}.1".format(i),
+                        "netmask": "255.255.255.0",
+                    },
+                    "mtu": 1500,
+                    "features": {"feature{0}".format(j): "on" for j in range(50)},
+                }
+                for i in range(interfaces)
+            },
+            "mounts": [
+                {"mount": "/mnt/{0}".format(i), "size_total": i * 1024, "options": "rw"}
+                for i in range(mounts)
+            ],
+        },
+    }
+
+
+def main(number=20):
+    record = fact_record()
+    cases = [
+        (
+            "drop_attributes",
+            lambda deep: drop_attributes(record, ["ansible_host"], deep),
+        ),
+        (
+            "alias_keys",
+            lambda deep: alias_keys(record, {"ansible_host": "address"}, deep),
+        ),
+        ("key_item", lambda deep: key_item(record, "inventory_hostname", True, deep)),
+    ]
+    print(
+        "{0:<20}{1:>14}{2:>14}{3:>10}".format(
+            "filter", "deep (ms)", "shallow (ms)", "speedup"
+        )
+    )
+    for name, fn in cases:
+        deep = timeit.timeit(lambda: fn(True), number=number) / number * 1000
+        shallow = timeit.timeit(lambda: fn(False), number=number) / number * 1000
+        print(
+            "{0:<20}{1:>14.3f}{2:>14.4f}{3:>9.0f}x".format(
+                name, deep, shallow, deep / shallow
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
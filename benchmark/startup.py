@@ -0,0 +1,104 @@
+"""
+Measure the import time and resident memory of loading FilterModule and
+TestModule in fresh interpreters, as every Ansible fork does:
+
+    python benchmark/startup.py --runs 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PLUGINS = {
+    "filters": ("filter_plugins", "custom_filters", "FilterModule().filters()"),
+    "tests": ("test_plugins", "custom_tests", "TestModule().tests()"),
+}
+HEAVY = ("netaddr", "yaml", "markupsafe")
+
+PROBE = """
+import json, os, resource, sys, time
+def rss_kb():
+    # current resident set size; ru_maxrss is a peak and only grows
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+sys.path.insert(0, {path!r})
+for name in {preload!r}:
+    __import__(name)
+before = rss_kb()
+start = time.perf_counter()
+import {module} as plugin
+plugin.{load}
+elapsed = time.perf_counter() - start
+after = rss_kb()
+print(json.dumps({{
+    "seconds": elapsed,
+    "rss_kb": after - before,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def probe(plugin, eager=False):
+    directory, module, load = PLUGINS[plugin]
+    code = PROBE.format(
+        path=os.path.join(HERE, "..", directory),
+        preload=list(HEAVY) if eager else [],
+        module=module,
+        load=load,
+        heavy=HEAVY,
+    )
+    output = subprocess.check_output([sys.executable, "-c", code])
+    return json.loads(output)
+
+
+def measure(plugin, runs, eager=False):
+    samples = [probe(plugin, eager) for _ in range(runs)]
+    return {
+        "plugin": plugin,
+        "preloaded": eager,
+        "median_s": statistics.median(x["seconds"] for x in samples),
+        "median_rss_kb": statistics.median(x["rss_kb"] for x in samples),
+        "heavy_modules": samples[0]["heavy"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--compare-preloaded",
+        action="store_true",
+        help="also measure with heavy dependencies already imported",
+    )
+    parser.add_argument("--output", help="write results as json to this path")
+    args = parser.parse_args(argv)
+    results = []
+    for plugin in PLUGINS:
+        for eager in (False, True) if args.compare_preloaded else (False,):
+            result = measure(plugin, args.runs, eager)
+            results.append(result)
+            print(
+                "{0:<10}{1:<12}{2:>10.2f}ms{3:>10}KB  {4}".format(
+                    plugin,
+                    "preloaded" if eager else "cold",
+                    result["median_s"] * 1000,
+                    result["median_rss_kb"],
+                    ",".join(result["heavy_modules"]) or "-",
+                )
+            )
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Time and measure peak memory for every filter and test plugin over
+synthetic inventories, optionally comparing against a stored baseline:
+
+    python benchmark/suite.py --scales 1000 10000 --output results.json
+    python benchmark/suite.py --baseline results.json --threshold 0.2
+"""
+
+import argparse
+import collections
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "filter_plugins"))
+sys.path.append(os.path.join(HERE, "..", "test_plugins"))
+
+import custom_filters as f  # noqa: E402
+import custom_tests as t  # noqa: E402
+
+SCALES = (1000, 10000, 100000)
+
+
+def address(i, base=10 << 24):
+    n = base + i
+    return "{0}.{1}.{2}.{3}".format(n >> 24, (n >> 16) & 255, (n >> 8) & 255, n & 255)
+
+
+def inventory(n):
+    return [
+        {
+            "name": "host{0:06d}".format(i),
+            "ansible_host": address(i),
+            "ip-address": address(i),
+            "host": "host{0:06d}.example.com".format(i),
+            "site": "dc{0}".format(i % 10),
+            "role": ("web", "db", "lb", "cache")[i % 4],
+            "mem": i % 64,
+            "facts": {"os": "ubuntu", "cpus": i % 16, "disks": ["sda", "sdb"]},
+        }
+        for i in range(n)
+    ]
+
+
+def wide_tree(n):
+    return {
+        "group{0}".format(g): {
+            "key{0}".format(k): {"value": k, "items": [k, str(k)]}
+            for k in range(max(1, n // 400))
+        }
+        for g in range(100)
+    }
+
+
+def deep_tree(depth):
+    tree = {"leaf": 1}
+    for i in range(depth):
+        tree = {"level{0}".format(i): tree, "value": i}
+    return tree
+
+
+def consume(iterable):
+    collections.deque(iterable, maxlen=0)
+
+
+def cases(n):
+    records = inventory(n)
+    small = records[: max(1, n // 10)]
+    names = [x["name"] for x in records]
+    wide = wide_tree(n)
+    overlay = {g: {"key0": {"items": ["extra"]}} for g in list(wide)[:50]}
+    drifted = f.deep_merge([wide, overlay], "append")
+    deep = deep_tree(min(n, 2000))
+    keyed = f.list_to_dict(records, "name")
+    spec = "{0}-{1}".format(address(0), address(n - 1))
+    taken = [address(i) for i in range(0, 2 * n, 2)]
+    zones = [{"zone": x["host"], "forwarders": ["10.0.0.1"]} for x in records] + [
+        {"network": "10.{0}.0.0/16".format(i), "forwarders": ["10.0.0.1"]}
+        for i in range(16)
+    ]
+    subnets = ["10.{0}.0.0/16".format(i) for i in range(256)] + ["10.0.0.0/8"]
+    groups = {"web": "^host0*[0-9]*[02468]$", "db": "^host0*[0-9]*[13579]$"}
+    pattern = {"name": "%s.example.com", "facts": {"os": "os-%s"}}
+    table = f.to_table(records)
+    small_table = f.to_table(small)
+    return {
+        "split_with": lambda: [f.split_with(x["host"], ".") for x in records],
+        "join_with": lambda: [f.join_with(x["facts"]["disks"], ",") for x in records],
+        "head": lambda: [f.head(x["facts"]["disks"]) for x in records],
+        "tail": lambda: [f.tail(x["facts"]["disks"]) for x in records],
+        "map_format": lambda: [f.map_format(x, pattern) for x in records],
+        "map_format_fresh": lambda: [
+            f.map_format(x, {"name": "%s.example.com", "facts": {"os": "os-%s"}})
+            for x in records
+        ],
+        "map_format_list": lambda: f.map_format_list(records, pattern),
+        "map_values": lambda: [f.map_values(x) for x in records],
+        "reverse_record": lambda: [f.reverse_record(x) for x in records],
+        "iter_reverse_records": lambda: consume(f.iter_reverse_records(records)),
+        "reverse_zones": lambda: f.reverse_zones(records),
+        "zone_fwd": lambda: [f.zone_fwd(x["host"], ["10.0.0.1"]) for x in records],
+        "zones_fwd": lambda: f.zones_fwd(zones),
+        "iter_zones_conf": lambda: consume(f.iter_zones_conf(zones)),
+        "zones_conf": lambda: f.zones_conf(zones),
+        "alias_keys": lambda: [f.alias_keys(x, {"name": "id"}) for x in records],
+        "merge_dicts": lambda: [f.merge_dicts(x, x["facts"]) for x in records],
+        "map_attributes": lambda: [
+            f.map_attributes(x, ["name", "site"]) for x in records
+        ],
+        "drop_attributes": lambda: [f.drop_attributes(x, ["facts"]) for x in records],
+        "select_attributes": lambda: [
+            f.select_attributes(x, ["name", "site"]) for x in records
+        ],
+        "project": lambda: f.project(records, ["name", "facts.os", ["site", "dc"]]),
+        "sort_records": lambda: f.sort_records(
+            records, ["site", "-ansible_host:ip", "name:natural"]
+        ),
+        "merge_dicts_reverse": lambda: [
+            f.merge_dicts_reverse(x, x["facts"]) for x in records
+        ],
+        "deep_merge": lambda: f.deep_merge([wide, overlay, wide], "unique"),
+        "to_dict": lambda: [f.to_dict(x["name"], "name") for x in records],
+        "merge_item": lambda: [f.merge_item(i, "name") for i in keyed.items()],
+        "key_item": lambda: [f.key_item(x, "name") for x in records],
+        "dict_to_list": lambda: f.dict_to_list(keyed, "name"),
+        "list_to_dict": lambda: f.list_to_dict(records, "name"),
+        "join_records": lambda: f.join_records(records, small, "name", "left"),
+        "inner_join": lambda: f.inner_join(records, small, "name"),
+        "left_join": lambda: f.left_join(records, small, "name"),
+        "anti_join": lambda: f.anti_join(records, small, "name"),
+        "to_kv": lambda: f.to_kv(wide),
+        "iter_kv": lambda: consume(f.iter_kv(deep)),
+        "to_safe_yaml": lambda: f.to_safe_yaml(small),
+        "sorted_get": lambda: [f.sorted_get(x, ["nope", "site"]) for x in records],
+        "ip_range": lambda: f.ip_range(spec),
+        "ip_range_lazy": lambda: f.ip_range_lazy(spec)[n // 2],
+        "ip_pool_next": lambda: f.ip_pool_next("10.0.0.0/8", taken, 100),
+        "ip_pool_free_ranges": lambda: f.ip_pool_free_ranges("10.0.0.0/8", taken),
+        "ip_pool_utilization": lambda: f.ip_pool_utilization("10.0.0.0/8", taken),
+        "cidr_summarize": lambda: f.cidr_summarize(taken),
+        "partition_network": lambda: f.partition_network(records, "10.0.0.0/20"),
+        "map_subnet": lambda: f.map_subnet(records, subnets),
+        "map_flatten": lambda: f.map_flatten(wide),
+        "map_diff": lambda: f.map_diff(wide, drifted),
+        "iter_flatten": lambda: consume(f.iter_flatten(deep)),
+        "map_join": lambda: [f.map_join(x, ["name", "site"]) for x in records],
+        "merge_join": lambda: [
+            f.merge_join(x, "label", ["name", "site"]) for x in records
+        ],
+        "map_group": lambda: f.map_group(records, ["site"], None, {"n": "count"}),
+        "to_table": lambda: f.to_table(records),
+        "to_records": lambda: f.to_records(table),
+        "table_select": lambda: f.table_select(table, ["name", "site"]),
+        "table_project": lambda: f.table_project(table, ["name", "facts.os"]),
+        "table_filter": lambda: f.table_filter(table, "role", "eq", "web"),
+        "table_group": lambda: f.table_group(table, ["site"], {"mem": ["sum", "mem"]}),
+        "table_join": lambda: f.table_join(table, small_table, "name", "left"),
+        "is_any_true": lambda: f.is_any_true(names),
+        "is_all_true": lambda: f.is_all_true(names),
+        "search_regex": lambda: [f.search_regex("^host0+1", x) for x in names],
+        "map_search_regex": lambda: f.map_search_regex(names, "^host0+1"),
+        "select_property": lambda: f.select_property(records, "^host0+1", "name"),
+        "classify_regex": lambda: f.classify_regex(names, groups),
+        "test_network": lambda: [t.test_network(x, "10.0.0.0/20") for x in records],
+        "test_property": lambda: [
+            t.test_property(x, "^host0+1", "name") for x in records
+        ],
+    }
+
+
+def check_coverage(names):
+    plugins = set(f.FilterModule().filters()) | set(t.TestModule().tests())
+    missing = sorted(plugins - set(names))
+    if missing:
+        raise SystemExit("Missing benchmark cases for: {0}".format(missing))
+
+
+def measure(fn, repeat):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"best_s": min(timings), "mean_s": sum(timings) / repeat, "peak_bytes": peak}
+
+
+def run(scales, repeat, only=None):
+    results = {}
+    for n in scales:
+        suite = cases(n)
+        check_coverage(suite)
+        for name, fn in sorted(suite.items()):
+            if only and name not in only:
+                continue
+            result = measure(fn, repeat)
+            results["{0}@{1}".format(name, n)] = result
+            print(
+                "{0:<28}{1:>8}{2:>12.4f}s{3:>14,}B".format(
+                    name, n, result["best_s"], result["peak_bytes"]
+                ),
+                flush=True,
+            )
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for case, result in sorted(results.items()):
+        if case not in baseline:
+            continue
+        before = baseline[case]["best_s"]
+        if before > 0 and result["best_s"] > before * (1 + threshold):
+            regressions.append((case, before, result["best_s"]))
+    for case, before, after in regressions:
+        print(
+            "REGRESSION {0}: {1:.4f}s -> {2:.4f}s ({3:+.0%})".format(
+                case, before, after, after / before - 1
+            )
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=list(SCALES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", help="run only these cases")
+    parser.add_argument("--output", help="write results as json to this path")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="relative slowdown reported as a regression (default 0.25)",
+    )
+    args = parser.parse_args(argv)
+    results = run(args.scales, args.repeat, args.only)
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                out,
+                indent=2,
+                sort_keys=True,
+            )
+    if args.baseline:
+        with open(args.baseline) as base:
+            baseline = json.load(base)["results"]
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,19 @@
-from markupsafe import soft_str
 import copy
 import itertools
-import yaml
 import sys
-import netaddr
+import os
 import functools
+import bisect
 import re
+import time
 
 if sys.version_info[0] < 3:
-    from collections import Sequence, defaultdict
+    from collections import Sequence, OrderedDict
 else:
     from collections.abc import Sequence
-    from collections import defaultdict
+    from collections import OrderedDict
+
+_MISSING = object()
 
 
 def is_hash(d):
@@ -28,10 +30,191 @@ def merge_dicts_reverse(x, y):
     return merge_dicts(y, x)
 
 
+_LIST_MERGES = ("replace", "append", "unique", "merge")
+
+
+def _trailing(values, kind):
+    i = len(values)
+    while i > 0 and kind(values[i - 1]):
+        i -= 1
+    return values[i:]
+
+
+def _unique_items(lists):
+    seen, items = set(), []
+    for item in itertools.chain.from_iterable(lists):
+        try:
+            if item in seen:
+                continue
+            seen.add(item)
+        except TypeError:
+            if item in items:
+                continue
+        items.append(item)
+    return items
+
+
+def deep_merge(layers, list_merge="replace", list_key=None):
+    """
+    Recursively merge a list of dicts, later layers taking precedence.
+    Values present in a single layer are reused rather than copied, so
+    only paths where layers overlap get new containers. list_merge
+    selects how overlapping lists combine: 'replace' keeps the last,
+    'append' concatenates, 'unique' concatenates skipping repeated
+    items and 'merge' deep merges dict items sharing the same list_key
+    value, appending the rest
+    """
+    if list_merge not in _LIST_MERGES:
+        raise ValueError(
+            "Unknown list_merge '{}', expected one of {}".format(
+                list_merge, _LIST_MERGES
+            )
+        )
+    if list_merge == "merge" and list_key is None:
+        raise ValueError("list_key is required to merge lists by key")
+    layers = list(layers)
+    if not all(is_hash(layer) for layer in layers):
+        raise ValueError("Arguments must be dictionaries")
+    root = [{}]
+    stack = [(layers, root, 0)]
+    while stack:
+        values, target, slot = stack.pop()
+        last = values[-1] if values else {}
+        if is_hash(last):
+            dicts = _trailing(values, is_hash)
+            if len(dicts) == 1 and target is not root:
+                target[slot] = last
+                continue
+            merged = {}
+            for d in dicts:
+                for k, v in d.items():
+                    if k in merged:
+                        merged[k].append(v)
+                    else:
+                        merged[k] = [v]
+            for k, vs in merged.items():
+                if len(vs) == 1:
+                    merged[k] = vs[0]
+                else:
+                    stack.append((vs, merged, k))
+            target[slot] = merged
+        elif isinstance(last, list) and list_merge != "replace":
+            lists = _trailing(values, lambda v: isinstance(v, list))
+            if len(lists) == 1:
+                target[slot] = last
+            elif list_merge == "append":
+                target[slot] = list(itertools.chain.from_iterable(lists))
+            elif list_merge == "unique":
+                target[slot] = _unique_items(lists)
+            else:
+                items, positions = [], {}
+                for item in itertools.chain.from_iterable(lists):
+                    if is_hash(item) and list_key in item:
+                        k = item[list_key]
+                        if k in positions:
+                            items[positions[k]].append(item)
+                            continue
+                        positions[k] = len(items)
+                        item = [item]
+                    items.append(item)
+                for i in positions.values():
+                    if len(items[i]) == 1:
+                        items[i] = items[i][0]
+                    else:
+                        stack.append((items[i], items, i))
+                target[slot] = items
+        else:
+            target[slot] = last
+    return root[0]
+
+
 def filename(basename):
     return basename.split(".")[0]
 
 
+def _format_key(pattern):
+    if is_hash(pattern):
+        return (dict, tuple((k, _format_key(v)) for k, v in pattern.items()))
+    hash(pattern)
+    return (type(pattern), pattern)
+
+
+def _compile_scalar_format(pattern):
+    from markupsafe import soft_str
+
+    fmt = soft_str(pattern)
+
+    def apply(value):
+        try:
+            return fmt % value
+        except TypeError:
+            return pattern
+
+    return apply
+
+
+def _compile_dict_format(pattern):
+    from markupsafe import soft_str
+
+    fields = {k: _compile_format(v) for k, v in pattern.items()}
+    default = _compile_format("%s")
+    fmt = soft_str(pattern)
+
+    def apply(value):
+        if is_hash(value):
+            return dict([[k, fields.get(k, default)(v)] for k, v in value.items()])
+        try:
+            return fmt % value
+        except TypeError:
+            # compiled patterns are shared, hand out a private copy
+            return copy.deepcopy(pattern)
+
+    return apply
+
+
+def _compile_uncached_format(pattern):
+    if is_hash(pattern):
+        return _compile_dict_format(pattern)
+    return _compile_scalar_format(pattern)
+
+
+def _pattern_from_key(key):
+    kind, pattern = key
+    if kind is dict:
+        return dict((k, _pattern_from_key(v)) for k, v in pattern)
+    return pattern
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_cached_format(key):
+    return _compile_uncached_format(_pattern_from_key(key))
+
+
+def _compile_format(pattern):
+    try:
+        key = _format_key(pattern)
+    except TypeError:
+        return _compile_uncached_format(pattern)
+    return _compile_cached_format(key)
+
+
+def _format_value(value, pattern):
+    if isinstance(pattern, str):
+        # soft_str leaves str and Markup patterns unchanged
+        try:
+            return pattern % value
+        except TypeError:
+            return pattern
+    if is_hash(pattern) and is_hash(value):
+        return {k: _format_value(v, pattern.get(k, "%s")) for k, v in value.items()}
+    from markupsafe import soft_str
+
+    try:
+        return soft_str(pattern) % value
+    except TypeError:
+        return copy.deepcopy(pattern) if is_hash(pattern) else pattern
+
+
 def map_format(value, pattern):
     """
     Apply python string formatting on an object:
@@ -39,28 +222,40 @@ def map_format(value, pattern):
         {{ "%s - %s"|format("Hello?", "Foo!") }}
             -> Hello? - Foo!
     """
-    if is_hash(value) and is_hash(pattern):
+    return _format_value(value, pattern)
 
-        def constant_factory(value):
-            return lambda: value
 
-        p = defaultdict(constant_factory("%s"))
-        p.update(pattern)
-        result = dict([[k, map_format(v, p[k])] for k, v in value.items()])
-    else:
-        try:
-            result = soft_str(pattern) % value
-        except TypeError:
-            result = pattern
-    return result
+def map_format_list(values, pattern):
+    """
+    Apply map_format with the same pattern to every item of values,
+    compiling the pattern only once
+    """
+    apply = _compile_format(pattern)
+    return [apply(value) for value in values]
 
 
 def map_values(d):
     return list(d.values())
 
 
+def _reverse_labels(version, value, prefixlen=None):
+    if version == 4:
+        labels = [str((value >> shift) & 0xFF) for shift in range(0, 32, 8)]
+        width, suffix = 8, "in-addr.arpa"
+    else:
+        labels = list("%032x" % value)[::-1]
+        width, suffix = 4, "ip6.arpa"
+    if prefixlen is not None:
+        labels = labels[len(labels) - prefixlen // width :]
+    return ".".join(labels + [suffix])
+
+
 def reverse_record(record):
     def reverse_address(addr):
+        if ":" in addr:
+            import netaddr
+
+            return _reverse_labels(6, int(netaddr.IPAddress(addr)))
         rev = ".".join(addr.split(".")[::-1])
         return "{0}.{1}".format(rev, "in-addr.arpa")
 
@@ -71,6 +266,57 @@ def reverse_record(record):
     }
 
 
+def iter_reverse_records(records, prefixlen=24, prefixlen6=64):
+    """
+    Yield PTR records for a list of {host, ip-address} records sorted
+    by address, each tagged with its reverse zone name under 'zone'.
+    IPv4 zones split on prefixlen (8, 16 or 24) and IPv6 zones on
+    prefixlen6 (a nibble boundary)
+    """
+    import netaddr
+
+    if prefixlen not in (8, 16, 24):
+        raise ValueError("IPv4 reverse zone prefix must be one of 8, 16 or 24")
+    if prefixlen6 % 4 != 0 or not 0 < prefixlen6 < 128:
+        raise ValueError("IPv6 reverse zone prefix must be a nibble boundary")
+    addresses = []
+    for record in records:
+        address = netaddr.IPAddress(record["ip-address"])
+        addresses.append((address.version, int(address), record["host"]))
+    addresses.sort(key=lambda a: (a[0], a[1]))
+    return _iter_reverse_records(addresses, prefixlen, prefixlen6)
+
+
+def _iter_reverse_records(addresses, prefixlen, prefixlen6):
+    zone_key = zone = None
+    for version, value, host in addresses:
+        zone_prefix = prefixlen if version == 4 else prefixlen6
+        key = (version, value >> ((32 if version == 4 else 128) - zone_prefix))
+        if key != zone_key:
+            zone_key = key
+            zone = _reverse_labels(version, value, zone_prefix)
+        yield {
+            "zone": zone,
+            "host": _reverse_labels(version, value),
+            "ip-address": host,
+            "type": "PTR",
+        }
+
+
+def reverse_zones(records, prefixlen=24, prefixlen6=64):
+    """
+    Group the PTR records for a list of {host, ip-address} records into
+    a list of {zone, records} items sorted by network and address
+    """
+    zones = []
+    for ptr in iter_reverse_records(records, prefixlen, prefixlen6):
+        zone = ptr.pop("zone")
+        if not zones or zones[-1]["zone"] != zone:
+            zones.append({"zone": zone, "records": []})
+        zones[-1]["records"].append(ptr)
+    return zones
+
+
 def with_ext(basename, ext):
     return "{0}.{1}".format(filename(basename), ext)
 
@@ -85,6 +331,77 @@ def zone_fwd(zone, servers):
     }
 
 
+def _reverse_zone_names(network):
+    import netaddr
+
+    net = netaddr.IPNetwork(network)
+    if net.version == 4:
+        width, zone_prefix = 32, min(24, max(8, -(-net.prefixlen // 8) * 8))
+    else:
+        width, zone_prefix = 128, min(124, max(4, -(-net.prefixlen // 4) * 4))
+    shift = width - zone_prefix
+    for n in range(net.first >> shift, (net.last >> shift) + 1):
+        yield (1, net.version, n << shift), _reverse_labels(
+            net.version, n << shift, zone_prefix
+        )
+
+
+def _forward_zones(zones):
+    definitions = {}
+    for z in zones:
+        if "network" in z:
+            names = _reverse_zone_names(z["network"])
+        else:
+            names = [((0, z["zone"].lower(), z["zone"]), z["zone"])]
+        for order, name in names:
+            body = zone_fwd(name, z["forwarders"])
+            if "forward" in z:
+                body['zone "{0}" IN'.format(name)]["forward"] = z["forward"]
+            definitions[name] = (order, body)
+    return [body for order, body in sorted(definitions.values(), key=lambda d: d[0])]
+
+
+def zones_fwd(zones):
+    """
+    Build the forward zone configuration for a list of zone definitions
+    in one pass. Each definition has forwarders and either a zone name
+    or a network, whose reverse zones are derived as reverse_record
+    names them (octet boundaries from /8 to /24 for IPv4, nibbles for
+    IPv6), plus an optional forward policy. Zones are ordered by name,
+    then reverse zones by network, and later definitions replace
+    earlier ones for the same zone
+    """
+    result = {}
+    for body in _forward_zones(zones):
+        result.update(body)
+    return result
+
+
+def _render_zone(name, body, indent="    "):
+    yield "{0} {{\n".format(name)
+    for k, v in body.items():
+        if isinstance(v, list):
+            items = "".join("{0}; ".format(x) for x in v)
+            yield "{0}{1} {{ {2}}};\n".format(indent, k, items)
+        else:
+            yield "{0}{1} {2};\n".format(indent, k, v)
+    yield "};\n"
+
+
+def iter_zones_conf(zones):
+    """
+    Lazily render the zones_fwd configuration as named.conf text, one
+    chunk at a time, in the same deterministic order
+    """
+    for body in _forward_zones(zones):
+        for name, options in body.items():
+            yield from _render_zone(name, options)
+
+
+def zones_conf(zones):
+    return "".join(iter_zones_conf(zones))
+
+
 def head(x):
     return x[0]
 
@@ -101,35 +418,207 @@ def join_with(x, d):
     return d.join(x)
 
 
-def alias_keys(d, alias={}):
-    new_dict = copy.deepcopy(d)
+def _copy_record(d, deep=False):
+    """
+    Copy a record for modification; shallow copies share nested values
+    with the input, deep copies clone them
+    """
+    return copy.deepcopy(d) if deep else dict(d)
+
+
+def alias_keys(d, alias={}, deep=False):
+    new_dict = _copy_record(d, deep)
     for k, v in list(alias.items()):
         new_dict[v] = new_dict[k]
     return new_dict
 
 
+def _projection_spec(atts):
+    if is_hash(atts):
+        return tuple((name, path) for name, path in atts.items())
+    return tuple(
+        (a, a) if isinstance(a, str) or not isinstance(a, Sequence) else (a[1], a[0])
+        for a in atts
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_projection(spec):
+    fields = tuple(
+        (
+            name,
+            key,
+            tuple(key.split(".")) if isinstance(key, str) and "." in key else None,
+        )
+        for name, key in spec
+    )
+    if all(name == key for name, key, _ in fields):
+        plain = frozenset(name for name, _, _ in fields)
+    else:
+        plain = None
+    return fields, plain
+
+
+def _project_value(d, key, path):
+    if key in d:
+        return d[key]
+    if path is None:
+        return _MISSING
+    cur = d
+    for p in path:
+        if is_hash(cur) and p in cur:
+            cur = cur[p]
+        elif isinstance(cur, list) and p.isdigit() and int(p) < len(cur):
+            cur = cur[int(p)]
+        else:
+            return _MISSING
+    return cur
+
+
+def _project_values(fields, d):
+    values = []
+    for _, key, path in fields:
+        v = _project_value(d, key, path)
+        if v is not _MISSING:
+            values.append(v)
+    return values
+
+
+def _project_record(fields, d):
+    new_dict = {}
+    for name, key, path in fields:
+        v = _project_value(d, key, path)
+        if v is not _MISSING:
+            new_dict[name] = v
+    return new_dict
+
+
+def project(l, atts, values=False):
+    """
+    Project a list of records onto atts, a list of attribute names,
+    dotted paths into nested values or [path, name] pairs, or a dict
+    of name to path. Records become dicts keyed by name, or lists of
+    values when values is set; missing attributes are skipped
+    """
+    fields, _ = _compile_projection(_projection_spec(atts))
+    if values:
+        return [_project_values(fields, d) for d in l]
+    return [_project_record(fields, d) for d in l]
+
+
 def map_attributes(d, atts):
     new_array = []
     for k in atts:
         if k in d:
-            new_array = new_array + [d[k]]
+            new_array.append(d[k])
+        elif isinstance(k, str) and "." in k:
+            v = _project_value(d, k, tuple(k.split(".")))
+            if v is not _MISSING:
+                new_array.append(v)
     return new_array
 
 
 def select_attributes(d, atts):
-    new_dict = {}
-    for k, v in list(d.items()):
-        if k in atts:
-            new_dict[k] = d[k]
+    wanted = atts
+    if isinstance(atts, list) and len(atts) > 8:
+        try:
+            wanted = frozenset(atts)
+        except TypeError:
+            pass
+    new_dict = {k: v for k, v in d.items() if k in wanted}
+    if isinstance(atts, str):
+        return new_dict
+    for k in atts:
+        if isinstance(k, str) and "." in k and k not in d:
+            v = _project_value(d, k, tuple(k.split(".")))
+            if v is not _MISSING:
+                new_dict[k] = v
     return new_dict
 
 
-def drop_attributes(d, x):
-    new_dict = copy.deepcopy(d)
-    for y in list(itertools.chain.from_iterable([x])):
-        if y in d:
-            del new_dict[y]
-    return new_dict
+def _ip_sort_key(v):
+    import netaddr
+
+    try:
+        address = netaddr.IPAddress(str(v))
+    except (netaddr.AddrFormatError, ValueError):
+        return (1, str(v))
+    return (0, address.version, int(address))
+
+
+_NATURAL_SPLIT = re.compile(r"(\d+)")
+
+
+def _natural_sort_key(v):
+    parts = _NATURAL_SPLIT.split(str(v))
+    parts[1::2] = [int(p) for p in parts[1::2]]
+    return parts
+
+
+_SORT_TYPES = {
+    "value": lambda v: v,
+    "ip": _ip_sort_key,
+    "natural": _natural_sort_key,
+    "version": _natural_sort_key,
+}
+
+
+def _sort_spec(key):
+    if is_hash(key):
+        attr = key["attribute"]
+        kind = key.get("type", "value")
+        descending = bool(key.get("reverse", False))
+    else:
+        attr, kind, descending = key, "value", False
+        if isinstance(attr, str):
+            if attr.startswith("-"):
+                attr, descending = attr[1:], True
+            name, sep, suffix = attr.rpartition(":")
+            if sep and suffix in _SORT_TYPES:
+                attr, kind = name, suffix
+    if kind not in _SORT_TYPES:
+        raise ValueError(
+            "Unknown sort type '{}', expected one of {}".format(
+                kind, sorted(_SORT_TYPES)
+            )
+        )
+    fields, _ = _compile_projection(_projection_spec([attr]))
+    _, attr_key, path = fields[0]
+    return attr_key, path, _SORT_TYPES[kind], descending
+
+
+def sort_records(l, keys, reverse=False):
+    """
+    Sort records by one or more attributes (names or dotted paths as in
+    map_attributes), computing every sort key once per record. A key is
+    'attr', '-attr' for descending order, optionally suffixed with
+    ':ip' (numeric address order), ':natural' or ':version' (numbers
+    within strings compared numerically), or a dict with attribute,
+    type and reverse. Records missing an attribute sort last for it
+    """
+    if isinstance(keys, str) or is_hash(keys):
+        keys = [keys]
+    specs = [_sort_spec(k) for k in keys]
+    descending = [desc != bool(reverse) for _, _, _, desc in specs]
+    decorated = []
+    for x in l:
+        row = []
+        for (key, path, sort_key, _), desc in zip(specs, descending):
+            v = _project_value(x, key, path)
+            row.append(((-1,) if desc else (1,)) if v is _MISSING else (0, sort_key(v)))
+        decorated.append((row, x))
+    if len(set(descending)) <= 1:
+        decorated.sort(key=lambda d: d[0], reverse=bool(descending and descending[0]))
+    else:
+        for i in reversed(range(len(specs))):
+            decorated.sort(key=lambda d: d[0][i], reverse=descending[i])
+    return [x for _, x in decorated]
+
+
+def drop_attributes(d, x, deep=False):
+    drop = set(itertools.chain.from_iterable([x]))
+    new_dict = {k: v for k, v in d.items() if k not in drop}
+    return copy.deepcopy(new_dict) if deep else new_dict
 
 
 def to_dict(x, key=None):
@@ -149,8 +638,8 @@ def merge_item(item, key_attr):
     return dict(merge_dicts(item[1], to_dict(item[0], key_attr)))
 
 
-def key_item(item, key_attr, remove_key=True):
-    new_item = copy.deepcopy(item)
+def key_item(item, key_attr, remove_key=True, deep=False):
+    new_item = _copy_record(item, deep)
     if remove_key:
         del new_item[key_attr]
     return [item[key_attr], new_item]
@@ -160,29 +649,175 @@ def dict_to_list(d, key_attr):
     return [merge_item(item, key_attr) for item in d.items()]
 
 
-def list_to_dict(l, key_attr, remove_key=True):
-    return dict([key_item(x, key_attr, remove_key) for x in l])
+def list_to_dict(l, key_attr, remove_key=True, deep=False):
+    return dict([key_item(x, key_attr, remove_key, deep) for x in l])
 
 
-def to_kv(d, sep=".", prefix=""):
-    if is_hash(d):
-        lvl = [
-            to_kv(v, sep, (prefix != "" and (prefix + sep) or "") + k)
-            for k, v in d.items()
-        ]
-        return list(itertools.chain.from_iterable(lvl))
-    elif isinstance(d, Sequence) and not isinstance(d, str):
-        lvl = [
-            to_kv(v, sep, (prefix != "" and (prefix + sep) or "") + str(i))
-            for i, v in list(enumerate(d))
-        ]
-        return list(itertools.chain.from_iterable(lvl))
+def _join_key(key_attr):
+    if isinstance(key_attr, str):
+        return lambda x: x[key_attr] if key_attr in x else _MISSING
+
+    key_atts = list(key_attr)
+
+    def key(x):
+        for k in key_atts:
+            if k not in x:
+                return _MISSING
+        return tuple(x[k] for k in key_atts)
+
+    return key
+
+
+_JOINS = ("inner", "left", "anti")
+_JOIN_DUPLICATES = ("all", "first", "last", "error")
+
+
+def join_records(left, right, key_attr, how="inner", right_key=None, duplicates="all"):
+    """
+    Hash join two record lists on key_attr, an attribute name or a list
+    of attributes as in map_group's key_atts, matched against right_key
+    (default key_attr) on the right side. Records missing a key
+    attribute never match. The smaller side is indexed once and results
+    follow left order; matched pairs are merged with right values
+    taking precedence.
+
+    how is 'inner', 'left' (unmatched left records are kept) or 'anti'
+    (only unmatched left records). duplicates controls repeated right
+    keys: 'all' joins every match, 'first' and 'last' keep one, and
+    'error' raises a ValueError listing every repeated right key,
+    whether or not it matches a left record.
+    """
+    if how not in _JOINS:
+        raise ValueError("Unknown join '{}', expected one of {}".format(how, _JOINS))
+    if duplicates not in _JOIN_DUPLICATES:
+        raise ValueError(
+            "Unknown duplicates policy '{}', expected one of {}".format(
+                duplicates, _JOIN_DUPLICATES
+            )
+        )
+    left = left if isinstance(left, Sequence) else list(left)
+    right = right if isinstance(right, Sequence) else list(right)
+    lkey = _join_key(key_attr)
+    rkey = _join_key(key_attr if right_key is None else right_key)
+    left_keys = [lkey(x) for x in left]
+    # duplicates are reported for the whole right side, so only index
+    # keys present on the left when nothing is checked
+    if duplicates == "error" or len(right) <= len(left):
+        wanted = None
     else:
-        return [{"key": prefix, "value": d}]
+        wanted = set(left_keys)
+    index = {}
+    for r in right:
+        k = rkey(r)
+        if k is _MISSING or (wanted is not None and k not in wanted):
+            continue
+        index.setdefault(k, []).append(r)
+    if duplicates == "error":
+        duplicated = [k for k, rs in index.items() if len(rs) > 1]
+        if duplicated:
+            raise ValueError("Duplicate join keys found: {}".format(duplicated))
+    elif duplicates == "first":
+        index = {k: rs[:1] for k, rs in index.items()}
+    elif duplicates == "last":
+        index = {k: rs[-1:] for k, rs in index.items()}
+    result = []
+    for x, k in zip(left, left_keys):
+        matches = None if k is _MISSING else index.get(k)
+        if how == "anti":
+            if not matches:
+                result.append(x)
+        elif matches:
+            result.extend({**x, **r} for r in matches)
+        elif how == "left":
+            result.append(dict(x))
+    return result
+
 
+def inner_join(left, right, key_attr, right_key=None, duplicates="all"):
+    return join_records(left, right, key_attr, "inner", right_key, duplicates)
 
-def to_safe_yaml(ds, indent=2):
-    return yaml.safe_dump(ds)
+
+def left_join(left, right, key_attr, right_key=None, duplicates="all"):
+    return join_records(left, right, key_attr, "left", right_key, duplicates)
+
+
+def anti_join(left, right, key_attr, right_key=None):
+    return join_records(left, right, key_attr, "anti", right_key)
+
+
+def _is_kv_container(d):
+    return is_hash(d) or (isinstance(d, Sequence) and not isinstance(d, str))
+
+
+def _kv_children(d, sep, prefix):
+    base = prefix != "" and (prefix + sep) or ""
+    if is_hash(d):
+        return ((base + k, v) for k, v in d.items())
+    return ((base + str(i), v) for i, v in enumerate(d))
+
+
+def _iter_kv(d, sep, prefix, max_depth, max_items):
+    count = 0
+    stack = [(0, iter([(prefix, d)]))]
+    while stack:
+        depth, items = stack[-1]
+        for key, v in items:
+            if _is_kv_container(v) and (max_depth is None or depth < max_depth):
+                stack.append((depth + 1, _kv_children(v, sep, key)))
+                break
+            if max_items is not None and count >= max_items:
+                return
+            count += 1
+            yield {"key": key, "value": v}
+        else:
+            stack.pop()
+
+
+def iter_kv(d, sep=".", prefix="", max_depth=None, max_items=None):
+    """
+    Lazily yield the {key, value} entries of to_kv. Values nested deeper
+    than max_depth levels are yielded whole, and iteration stops after
+    max_items entries
+    """
+    return _iter_kv(d, sep, prefix, max_depth, max_items)
+
+
+def to_kv(d, sep=".", prefix=""):
+    return list(_iter_kv(d, sep, prefix, None, None))
+
+
+@functools.lru_cache(maxsize=None)
+def _safe_dumper(libyaml=False):
+    import yaml
+
+    dumper = yaml.SafeDumper
+    if libyaml:
+        dumper = getattr(yaml, "CSafeDumper", dumper)
+    dumper.add_representer(LazyIPRange, lambda d, data: d.represent_list(list(data)))
+    return dumper
+
+
+def to_safe_yaml(ds, indent=2, dest=None):
+    """
+    Dump ds as safe YAML, as yaml.safe_dump does. When dest is given the
+    document is streamed to that file path and the path is returned
+    instead of the document
+    """
+    import yaml
+
+    # libyaml is faster but emits some documents differently (top level
+    # scalars, empty and long keys), so it is only used on request
+    libyaml = os.environ.get("NEPHELAIIO_PLUGINS_YAML_LIBYAML", "").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    dumper = _safe_dumper(libyaml)
+    if dest is None:
+        return yaml.dump(ds, Dumper=dumper, indent=indent)
+    with open(dest, "w") as stream:
+        yaml.dump(ds, stream, Dumper=dumper, indent=indent)
+    return dest
 
 
 def sorted_get(d, ks):
@@ -192,45 +827,422 @@ def sorted_get(d, ks):
     raise KeyError("None of {} keys found".format(ks))
 
 
+def _parse_ip_spec(spec):
+    """
+    Parse a comma separated list of addresses, start-end ranges and CIDRs
+    into a list of (first, last, version) integer bounds
+    """
+    import netaddr
+
+    bounds = []
+    for part in spec.split(","):
+        part = part.strip()
+        if "/" in part:
+            net = netaddr.IPNetwork(part)
+            bounds.append((net.first, net.last, net.version))
+            continue
+        addrs = part.split("-")
+        start = netaddr.IPAddress(addrs[0].strip())
+        end = start if len(addrs) == 1 else netaddr.IPAddress(addrs[1].strip())
+        if start.version != end.version:
+            raise TypeError("start and stop IP versions do not match!")
+        bounds.append((int(start), int(end), start.version))
+    return bounds
+
+
+def _parse_ip_specs(specs):
+    if isinstance(specs, str):
+        specs = [specs]
+    return itertools.chain.from_iterable(_parse_ip_spec(s) for s in specs)
+
+
+class LazyIPRange(Sequence):
+    """
+    Read-only sequence of address strings backed by integer bounds;
+    addresses are only rendered as strings when they are read
+    """
+
+    def __init__(self, bounds):
+        self._bounds = [(f, la, v) for f, la, v in bounds if f <= la]
+        self._offsets = []
+        total = 0
+        for first, last, _ in self._bounds:
+            self._offsets.append(total)
+            total += last - first + 1
+        self._len = total
+
+    def __len__(self):
+        return self._len
+
+    def _locate(self, i):
+        n = bisect.bisect_right(self._offsets, i) - 1
+        first, _, version = self._bounds[n]
+        return first + i - self._offsets[n], version
+
+    def __getitem__(self, i):
+        import netaddr
+
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self._len)
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            bounds = []
+            for offset, (first, last, version) in zip(self._offsets, self._bounds):
+                lo = max(first, first + start - offset)
+                hi = min(last, first + stop - 1 - offset)
+                if lo <= hi:
+                    bounds.append((lo, hi, version))
+            return LazyIPRange(bounds)
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("ip range index out of range")
+        return str(netaddr.IPAddress(*self._locate(i)))
+
+    def __iter__(self):
+        import netaddr
+
+        for first, last, version in self._bounds:
+            for n in range(first, last + 1):
+                yield str(netaddr.IPAddress(n, version))
+
+    def __contains__(self, addr):
+        import netaddr
+
+        try:
+            ip = netaddr.IPAddress(str(addr).strip())
+        except (netaddr.AddrFormatError, ValueError, TypeError):
+            return False
+        value = int(ip)
+        return any(
+            first <= value <= last and version == ip.version
+            for first, last, version in self._bounds
+        )
+
+    def __eq__(self, other):
+        if isinstance(other, LazyIPRange):
+            if self._bounds == other._bounds:
+                return True
+        elif not isinstance(other, (list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            x == y for x, y in zip(self, other)
+        )
+
+    __hash__ = None
+
+    def __add__(self, other):
+        if not isinstance(other, (list, tuple, LazyIPRange)):
+            return NotImplemented
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        if not isinstance(other, (list, tuple)):
+            return NotImplemented
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    __str__ = __repr__
+
+
 def ip_range(spec):
-    addrs = spec.split("-")
-    start = addrs[0]
-    end = start if len(addrs) == 1 else addrs[1]
-    return [str(ip) for ip in netaddr.iter_iprange(start, end)]
+    return list(LazyIPRange(_parse_ip_spec(spec)))
+
+
+def ip_range_lazy(spec):
+    """
+    ip_range as a LazyIPRange, supporting len, indexing, slicing and
+    membership without rendering every address; convert it with list
+    before serializing to json
+    """
+    return LazyIPRange(_parse_ip_spec(spec))
+
+
+def _merge_intervals(bounds):
+    merged = []
+    for first, last, version in sorted(bounds, key=lambda b: (b[2], b[0])):
+        if merged and merged[-1][2] == version and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last, version)
+        elif first <= last:
+            merged.append((first, last, version))
+    return merged
+
+
+def _free_intervals(spec, used):
+    pool = _merge_intervals(_parse_ip_spec(spec))
+    taken = _merge_intervals(_parse_ip_specs(used))
+    free, i = [], 0
+    for first, last, version in pool:
+        while i < len(taken) and (taken[i][2], taken[i][1]) < (version, first):
+            i += 1
+        j = i
+        while j < len(taken) and taken[j][2] == version and taken[j][0] <= last:
+            if taken[j][0] > first:
+                free.append((first, taken[j][0] - 1, version))
+            first = max(first, taken[j][1] + 1)
+            j += 1
+        if first <= last:
+            free.append((first, last, version))
+    return pool, free
+
+
+def cidr_summarize(specs):
+    """
+    Collapse addresses, ranges and CIDRs in ip_range syntax into the
+    minimal list of CIDRs covering exactly the same addresses
+    """
+    import netaddr
+
+    cidrs = []
+    for first, last, version in _merge_intervals(_parse_ip_specs(specs)):
+        width = 32 if version == 4 else 128
+        while first <= last:
+            size = first & -first if first else 1 << width
+            while first + size - 1 > last:
+                size >>= 1
+            cidrs.append(
+                "{0}/{1}".format(
+                    netaddr.IPAddress(first, version), width - size.bit_length() + 1
+                )
+            )
+            first += size
+    return cidrs
+
+
+def ip_pool_next(spec, used=[], count=1):
+    """
+    Return the lowest count free addresses of a pool given in ip_range
+    syntax (addresses, start-end ranges and CIDRs) after removing used
+    addresses or ranges
+    """
+    _, free = _free_intervals(spec, used)
+    return list(itertools.islice(LazyIPRange(free), count))
+
+
+def ip_pool_free_ranges(spec, used=[]):
+    """
+    Return the free intervals of a pool as start-end ranges, or single
+    addresses, in ip_range syntax
+    """
+    import netaddr
+
+    _, free = _free_intervals(spec, used)
+    return [
+        (
+            str(netaddr.IPAddress(first, version))
+            if first == last
+            else "{0}-{1}".format(
+                netaddr.IPAddress(first, version), netaddr.IPAddress(last, version)
+            )
+        )
+        for first, last, version in free
+    ]
+
+
+def ip_pool_utilization(spec, used=[]):
+    """
+    Return the size, used and free address counts of a pool and the
+    fraction of it in use
+    """
+    pool, free = _free_intervals(spec, used)
+    size = sum(last - first + 1 for first, last, _ in pool)
+    available = sum(last - first + 1 for first, last, _ in free)
+    return {
+        "size": size,
+        "used": size - available,
+        "free": available,
+        "utilization": (size - available) / size if size else 0.0,
+    }
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_network(net):
+    import netaddr
+
+    network = netaddr.IPNetwork(net)
+    return (network.first, network.last, network.version)
+
+
+def partition_network(l, nets, prop="ansible_host"):
+    """
+    Split records into [matching, rest] according to whether their prop
+    address belongs to any of nets (a CIDR or a list of CIDRs)
+    """
+    import netaddr
+
+    if isinstance(nets, str):
+        nets = [nets]
+    bounds = [_compile_network(net) for net in nets]
+    matching, rest = [], []
+    for x in l:
+        if prop in x:
+            address = netaddr.IPAddress(x[prop])
+            value, version = int(address), address.version
+            if any(v == version and f <= value <= la for f, la, v in bounds):
+                matching.append(x)
+                continue
+        rest.append(x)
+    return [matching, rest]
+
+
+@functools.lru_cache(maxsize=64)
+def _subnet_index(cidrs):
+    import netaddr
+
+    index = {}
+    for cidr in cidrs:
+        net = netaddr.IPNetwork(cidr)
+        width = 32 if net.version == 4 else 128
+        tables = index.setdefault(net.version, {})
+        prefixes = tables.setdefault(net.prefixlen, {})
+        prefixes.setdefault(net.first >> (width - net.prefixlen), cidr)
+    return {
+        version: (32 if version == 4 else 128, sorted(tables.items(), reverse=True))
+        for version, tables in index.items()
+    }
+
+
+def _longest_match(index, addr):
+    import netaddr
+
+    address = netaddr.IPAddress(addr)
+    if address.version not in index:
+        return None
+    width, tables = index[address.version]
+    value = int(address)
+    for prefixlen, prefixes in tables:
+        cidr = prefixes.get(value >> (width - prefixlen))
+        if cidr is not None:
+            return cidr
+    return None
+
+
+def map_subnet(
+    l, subnets, prop="ansible_host", attr="subnet", meta_attr="subnet_meta"
+):
+    """
+    Annotate records with the most specific of subnets containing their
+    prop address. When subnets is a dict of cidr to metadata, the
+    matching metadata is also set under meta_attr. Indexes are cached
+    per subnet list and reused across calls.
+    """
+    index = _subnet_index(tuple(subnets))
+    result = []
+    for x in l:
+        cidr = _longest_match(index, x[prop]) if prop in x else None
+        item = {**x, attr: cidr}
+        if is_hash(subnets):
+            item[meta_attr] = None if cidr is None else subnets[cidr]
+        result.append(item)
+    return result
+
+
+def _flatten_children(o):
+    if isinstance(o, dict):
+        return iter(o.items())
+    return ((str(i), v) for i, v in enumerate(o))
+
+
+def _iter_flatten(o, env):
+    stack = [(env, _flatten_children(o))]
+    while stack:
+        env, children = stack[-1]
+        for k, v in children:
+            path = k if env == "" else f"{env}.{k}"
+            if isinstance(v, dict) or isinstance(v, list):
+                if path == "" and not isinstance(v, dict):
+                    raise ValueError("Argument must be dictionary")
+                stack.append((path, _flatten_children(v)))
+                break
+            yield path, v
+        else:
+            stack.pop()
+
+
+def iter_flatten(o, env=""):
+    """
+    Lazily yield (path, value) pairs for every leaf of a nested dict,
+    in the same order and with the same dotted paths as map_flatten
+    """
+    if env == "" and not isinstance(o, dict):
+        raise ValueError("Argument must be dictionary")
+    if not (isinstance(o, dict) or isinstance(o, list)):
+        return iter([])
+    return _iter_flatten(o, env)
 
 
 def map_flatten(o, env=""):
     if env == "" and not isinstance(o, dict):
         raise ValueError("Argument must be dictionary")
+    elif isinstance(o, dict) or isinstance(o, list):
+        return dict(_iter_flatten(o, env))
     else:
-        if isinstance(o, dict):
-            flattened = {}
-            for k, v in o.items():
-                if env == "":
-                    newenv = k
-                else:
-                    newenv = f"{env}.{k}"
-                if isinstance(v, dict) or isinstance(v, list):
-                    item = map_flatten(v, newenv)
-                else:
-                    item = {newenv: v}
-                flattened = {**flattened, **item}
-            return flattened
-        elif isinstance(o, list):
-            flattened = {}
-            for i in range(len(o)):
-                if env == "":
-                    newenv = f"{i}"
-                else:
-                    newenv = f"{env}.{i}"
-                if isinstance(o[i], dict) or isinstance(o[i], list):
-                    item = map_flatten(o[i], newenv)
-                else:
-                    item = {newenv: o[i]}
-                flattened = {**flattened, **item}
-            return flattened
+        return o
+
+
+def _diff_children(env, a, b):
+    if isinstance(a, dict):
+        for k, va in a.items():
+            yield (k if env == "" else f"{env}.{k}"), va, b[k] if k in b else _MISSING
+        for k, vb in b.items():
+            if k not in a:
+                yield (k if env == "" else f"{env}.{k}"), _MISSING, vb
+    else:
+        for i in range(max(len(a), len(b))):
+            path = f"{i}" if env == "" else f"{env}.{i}"
+            yield path, a[i] if i < len(a) else _MISSING, (
+                b[i] if i < len(b) else _MISSING
+            )
+
+
+def _diff_leaves(path, v, change, side):
+    if isinstance(v, dict) or isinstance(v, list):
+        leaves = _iter_flatten(v, path)
+    else:
+        leaves = [(path, v)]
+    for p, leaf in leaves:
+        yield {"path": p, "change": change, side: leaf}
+
+
+def _iter_diff(old, new):
+    stack = [_diff_children("", old, new)]
+    while stack:
+        for path, a, b in stack[-1]:
+            if a is b:
+                continue
+            if (isinstance(a, dict) and isinstance(b, dict)) or (
+                isinstance(a, list) and isinstance(b, list)
+            ):
+                stack.append(_diff_children(path, a, b))
+                break
+            a_leaf = not (isinstance(a, dict) or isinstance(a, list))
+            b_leaf = not (isinstance(b, dict) or isinstance(b, list))
+            if a is _MISSING:
+                yield from _diff_leaves(path, b, "added", "new")
+            elif b is _MISSING:
+                yield from _diff_leaves(path, a, "removed", "old")
+            elif a_leaf and b_leaf:
+                if a != b:
+                    yield {"path": path, "change": "changed", "old": a, "new": b}
+            else:
+                yield from _diff_leaves(path, a, "removed", "old")
+                yield from _diff_leaves(path, b, "added", "new")
         else:
-            return o
+            stack.pop()
+
+
+def map_diff(old, new, limit=None):
+    """
+    Compare two dicts in a single walk, returning the added, removed and
+    changed leaf paths as map_flatten would name them. Subtrees shared
+    by both sides are skipped and at most limit differences are returned
+    """
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        raise ValueError("Arguments must be dictionaries")
+    return list(itertools.islice(_iter_diff(old, new), limit))
 
 
 def map_join(d, atts, sep=" "):
@@ -244,31 +1256,105 @@ def merge_join(d, attr, atts, sep=" "):
     return {**d, **item}
 
 
-def map_group(l, key_atts, group_att=None):
+def _distinct_step(acc, v):
+    seen, values = acc
+    try:
+        if v in seen:
+            return acc
+        seen.add(v)
+    except TypeError:
+        if v in values:
+            return acc
+    values.append(v)
+    return acc
+
+
+_GROUP_AGGREGATES = {
+    "count": (lambda: 0, lambda acc, v: acc + 1, None),
+    "sum": (lambda: 0, lambda acc, v: acc + v, None),
+    "min": (
+        lambda: _MISSING,
+        lambda acc, v: v if acc is _MISSING or v < acc else acc,
+        None,
+    ),
+    "max": (
+        lambda: _MISSING,
+        lambda acc, v: v if acc is _MISSING or v > acc else acc,
+        None,
+    ),
+    "first": (lambda: _MISSING, lambda acc, v: v if acc is _MISSING else acc, None),
+    "last": (lambda: _MISSING, lambda acc, v: v, None),
+    "distinct": (lambda: (set(), []), _distinct_step, lambda acc: acc[1]),
+}
+
+
+def _compile_aggregates(aggregates):
+    compiled = []
+    for field, spec in aggregates.items():
+        if isinstance(spec, str):
+            op, att = spec, None
+        else:
+            op, att = spec[0], (spec[1] if len(spec) > 1 else None)
+        if op not in _GROUP_AGGREGATES:
+            raise ValueError(
+                "Unknown aggregate '{}', expected one of {}".format(
+                    op, sorted(_GROUP_AGGREGATES)
+                )
+            )
+        init, step, finish = _GROUP_AGGREGATES[op]
+        compiled.append((field, att, init, step, finish))
+    return compiled
+
+
+def map_group(l, key_atts, group_att=None, aggregates=None):
+    """
+    Group records by the values of key_atts in a single pass.
+
+    Each group carries its key attributes plus a list of the grouped
+    records (without key attributes) under 'data', or the list of
+    group_att values under group_att. aggregates maps output fields to
+    an operation ('count', 'sum', 'min', 'max', 'first', 'last',
+    'distinct') or an [operation, attribute] pair; operations without
+    an attribute apply to the grouped items themselves.
+    """
     data_field = group_att or "data"
+    key_set = set(key_atts)
+    nkeys = len(key_atts)
+    aggs = _compile_aggregates(aggregates or {})
     groups = {}
+    states = {}
     for x in l:
-        _key = tuple(map_attributes(x, key_atts))
-        if _key in groups:
-            cur_item = groups[_key]
-            cur_data = cur_item[data_field]
-        else:
-            cur_item = {}
-            cur_data = []
-        group_atts = select_attributes(x, key_atts)
+        if group_att is not None and group_att not in x:
+            continue
+        _key = tuple(x[k] for k in key_atts if k in x)
+        group = groups.get(_key)
+        if group is None:
+            group = {k: v for k, v in x.items() if k in key_set}
+            group[data_field] = []
+            groups[_key] = group
+            states[_key] = [init() for _, _, init, _, _ in aggs]
+        elif len(_key) < nkeys:
+            group.update(
+                (k, v) for k, v in x.items() if k in key_set and k != data_field
+            )
         if group_att is None:
-            groups[_key] = {
-                **cur_item,
-                **group_atts,
-                **{data_field: cur_data + [drop_attributes(x, key_atts)]},
-            }
+            item = {k: v for k, v in x.items() if k not in key_set}
         else:
-            if group_att in x:
-                groups[_key] = {
-                    **cur_item,
-                    **group_atts,
-                    **{data_field: cur_data + [x[group_att]]},
-                }
+            item = x[group_att]
+        group[data_field].append(item)
+        if aggs:
+            state = states[_key]
+            for i, (_, att, _, step, _) in enumerate(aggs):
+                if att is None:
+                    state[i] = step(state[i], item)
+                elif att in x:
+                    state[i] = step(state[i], x[att])
+    if aggs:
+        for _key, group in groups.items():
+            for (field, _, _, _, finish), acc in zip(aggs, states[_key]):
+                if finish is not None:
+                    acc = finish(acc)
+                group[field] = None if acc is _MISSING else acc
     return list(groups.values())
 
 
@@ -280,43 +1366,601 @@ def is_all_true(xs):
     return functools.reduce(lambda x, y: x and y, map(lambda x: bool(x), xs), True)
 
 
+_compile_regex = functools.lru_cache(
+    maxsize=int(os.environ.get("NEPHELAIIO_PLUGINS_REGEX_CACHE_SIZE", 1024))
+)(re.compile)
+
+
+def regex_cache_info():
+    info = _compile_regex.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+    }
+
+
 def search_regex(r, s):
-    return bool(re.match(r, s))
+    return bool(_compile_regex(r).match(s))
+
+
+def map_search_regex(xs, r):
+    match = _compile_regex(r).match
+    return [bool(match(s)) for s in xs]
+
+
+def select_property(l, regex=".*", prop=""):
+    match = _compile_regex(regex).match
+    return [x for x in l if prop in x and match(x[prop])]
+
+
+# backreferences, numbered conditionals and inline global flags change
+# meaning once patterns are wrapped in a combined alternation
+_NOT_COMBINABLE = re.compile(r"\\[1-9]|\(\?P=|\(\?[aiLmsux-]+\)|\(\?\(\d")
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_classifier(patterns):
+    matchers = [_compile_regex(p).match for p in patterns]
+    if any(_NOT_COMBINABLE.search(p) for p in patterns):
+        return None, matchers
+    try:
+        combined = re.compile(
+            "|".join("(?P<g{0}>{1})".format(i, p) for i, p in enumerate(patterns))
+        )
+    except re.error:
+        return None, matchers
+    return combined.match, matchers
+
+
+def classify_regex(xs, groups, multiple=False, default=None):
+    """
+    Assign strings to the groups of a {group: pattern} mapping whose
+    pattern matches them as search_regex would. Each string goes to its
+    first matching group, or to every matching group when multiple is
+    set; unmatched strings go to the default group when one is given.
+    """
+    names = list(groups.keys())
+    combined, matchers = _compile_classifier(tuple(groups[n] for n in names))
+    result = {n: [] for n in names}
+    if default is not None:
+        result.setdefault(default, [])
+    for s in xs:
+        if combined is not None and not multiple:
+            m = combined(s)
+            matched = [names[int(m.lastgroup[1:])]] if m else []
+        elif combined is not None and not combined(s):
+            matched = []
+        else:
+            matched = [n for n, match in zip(names, matchers) if match(s)]
+            if not multiple:
+                matched = matched[:1]
+        if not matched and default is not None:
+            matched = [default]
+        for n in matched:
+            result[n].append(s)
+    return result
+
+
+def _compact_column(values):
+    import array
+
+    if values and all(type(v) is int for v in values):
+        try:
+            return array.array("q", values)
+        except OverflowError:
+            return values
+    if values and all(type(v) is float for v in values):
+        return array.array("d", values)
+    return values
+
+
+class RecordTable(object):
+    """
+    Column oriented record list; each column holds one value per row,
+    homogeneous int and float columns as compact arrays and missing
+    values as a sentinel in the others. Build with to_table and convert
+    back with to_records
+    """
+
+    def __init__(self, columns, length):
+        self.columns = columns
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return "RecordTable(rows={0}, columns={1})".format(
+            self.length, list(self.columns)
+        )
+
+    def _take(self, rows):
+        import array
+
+        columns = {}
+        for name, column in self.columns.items():
+            if isinstance(column, array.array):
+                columns[name] = array.array(column.typecode, (column[i] for i in rows))
+            else:
+                columns[name] = _compact_column([column[i] for i in rows])
+        return RecordTable(columns, len(rows))
+
+    def _keys(self, key_attr):
+        if isinstance(key_attr, str):
+            return self.columns.get(key_attr, [_MISSING] * self.length)
+        columns = [self.columns.get(k, [_MISSING] * self.length) for k in key_attr]
+        return [
+            _MISSING if any(v is _MISSING for v in key) else key
+            for key in zip(*columns)
+        ]
+
+
+def to_table(l):
+    columns = {}
+    n = 0
+    for x in l:
+        for k, v in x.items():
+            column = columns.get(k)
+            if column is None:
+                column = columns[k] = [_MISSING] * n
+            column.append(v)
+        n += 1
+        for column in columns.values():
+            if len(column) < n:
+                column.append(_MISSING)
+    return RecordTable({k: _compact_column(c) for k, c in columns.items()}, n)
+
+
+def to_records(table):
+    columns = list(table.columns.items())
+    return [
+        {k: column[i] for k, column in columns if column[i] is not _MISSING}
+        for i in range(table.length)
+    ]
+
+
+def table_select(table, atts):
+    """Keep only the atts columns of a table, sharing their storage"""
+    return RecordTable(
+        {k: table.columns[k] for k in atts if k in table.columns}, table.length
+    )
+
+
+def table_project(table, atts):
+    """
+    Project a table onto atts as project does for records: names,
+    dotted paths into nested values and renames. Plain columns are
+    shared, nested paths are extracted once per row
+    """
+    fields, _ = _compile_projection(_projection_spec(atts))
+    columns = {}
+    for name, key, path in fields:
+        if key in table.columns:
+            columns[name] = table.columns[key]
+        elif path is not None and path[0] in table.columns:
+            head = path[0]
+            columns[name] = _compact_column(
+                [
+                    _MISSING if v is _MISSING else _project_value({head: v}, key, path)
+                    for v in table.columns[head]
+                ]
+            )
+    return RecordTable(columns, table.length)
+
+
+def _table_match(regex):
+    match = _compile_regex(regex).match
+    return lambda v, _: isinstance(v, str) and bool(match(v))
+
+
+def _table_network(net):
+    import netaddr
+
+    first, last, version = _compile_network(net)
+
+    def test(v, _):
+        address = netaddr.IPAddress(v)
+        return address.version == version and first <= int(address) <= last
+
+    return test
+
+
+_TABLE_TESTS = {
+    "eq": lambda v, x: v == x,
+    "ne": lambda v, x: v != x,
+    "lt": lambda v, x: v < x,
+    "le": lambda v, x: v <= x,
+    "gt": lambda v, x: v > x,
+    "ge": lambda v, x: v >= x,
+    "in": lambda v, x: v in x,
+    "defined": lambda v, x: True,
+}
+
+
+def table_filter(table, attr, test="eq", value=None):
+    """
+    Keep the rows of a table whose attr value passes test against value:
+    'eq', 'ne', 'lt', 'le', 'gt', 'ge', 'in', 'defined', 'match' (as
+    search_regex) or 'network' (address inside the value CIDR). Rows
+    missing attr never pass
+    """
+    if test == "match":
+        check = _table_match(value)
+    elif test == "network":
+        check = _table_network(value)
+    elif test in _TABLE_TESTS:
+        check = _TABLE_TESTS[test]
+    else:
+        raise ValueError(
+            "Unknown table test '{}', expected one of {}".format(
+                test, sorted(list(_TABLE_TESTS) + ["match", "network"])
+            )
+        )
+    column = table.columns.get(attr)
+    if column is None:
+        return table._take([])
+    return table._take(
+        [i for i, v in enumerate(column) if v is not _MISSING and check(v, value)]
+    )
+
+
+def table_group(table, key_atts, aggregates=None):
+    """
+    Group table rows by key_atts in one pass into a table holding the
+    key columns and one column per aggregate (default a 'count'), as
+    map_group computes them: rows missing key attributes group on the
+    values they have. Only count may omit its attribute
+    """
+    if aggregates is None:
+        aggregates = {"count": "count"}
+    for field, spec in aggregates.items():
+        op = spec if isinstance(spec, str) else spec[0]
+        if op != "count" and (isinstance(spec, str) or len(spec) < 2):
+            raise ValueError(
+                "Aggregate '{}' needs an attribute, only count applies to "
+                "table rows".format(field)
+            )
+    aggs = _compile_aggregates(aggregates)
+    nkeys = len(key_atts)
+    key_columns = [
+        (k, table.columns.get(k, [_MISSING] * table.length)) for k in key_atts
+    ]
+    columns = [table.columns.get(att) if att else None for _, att, _, _, _ in aggs]
+    groups = {}
+    for i in range(table.length):
+        present = [(k, c[i]) for k, c in key_columns if c[i] is not _MISSING]
+        key = tuple(v for _, v in present)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = (dict(present), [init() for _, _, init, _, _ in aggs])
+        elif len(key) < nkeys:
+            group[0].update(present)
+        state = group[1]
+        for j, ((_, att, _, step, _), column) in enumerate(zip(aggs, columns)):
+            if att is None:
+                state[j] = step(state[j], None)
+            elif column is not None and column[i] is not _MISSING:
+                state[j] = step(state[j], column[i])
+    result = {
+        k: [header.get(k, _MISSING) for header, _ in groups.values()] for k in key_atts
+    }
+    for j, (field, _, _, _, finish) in enumerate(aggs):
+        values = []
+        for _, state in groups.values():
+            acc = state[j] if finish is None else finish(state[j])
+            values.append(None if acc is _MISSING else acc)
+        result[field] = values
+    return RecordTable({k: _compact_column(v) for k, v in result.items()}, len(groups))
+
+
+def table_join(left, right, key_attr, how="inner", right_key=None):
+    """
+    Hash join two tables with join_records semantics: key_attr is an
+    attribute or list of attributes matched against right_key, how is
+    'inner', 'left' or 'anti' and right values take precedence
+    """
+    if how not in _JOINS:
+        raise ValueError("Unknown join '{}', expected one of {}".format(how, _JOINS))
+    index = {}
+    for j, key in enumerate(right._keys(key_attr if right_key is None else right_key)):
+        if key is not _MISSING:
+            index.setdefault(key, []).append(j)
+    left_rows, right_rows = [], []
+    for i, key in enumerate(left._keys(key_attr)):
+        matches = None if key is _MISSING else index.get(key)
+        if how == "anti":
+            if not matches:
+                left_rows.append(i)
+        elif matches:
+            left_rows.extend([i] * len(matches))
+            right_rows.extend(matches)
+        elif how == "left":
+            left_rows.append(i)
+            right_rows.append(None)
+    if how == "anti":
+        return left._take(left_rows)
+    columns = {}
+    for name, column in left.columns.items():
+        columns[name] = [column[i] for i in left_rows]
+    for name, column in right.columns.items():
+        values = columns.get(name, [_MISSING] * len(left_rows))
+        for n, j in enumerate(right_rows):
+            if j is not None and column[j] is not _MISSING:
+                values[n] = column[j]
+        columns[name] = values
+    return RecordTable(
+        {k: _compact_column(v) for k, v in columns.items()}, len(left_rows)
+    )
+
+
+class _Memo(object):
+    """
+    Size bounded LRU cache of filter results keyed on a digest of the
+    pickled filter name and arguments. Results are kept pickled, so
+    every hit returns a private copy built at C speed
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def wrap(self, name, fn):
+        import hashlib
+        import pickle
+
+        @functools.wraps(fn)
+        def memoized(*args, **kwargs):
+            try:
+                key = hashlib.sha256(pickle.dumps((name, args, kwargs), 4)).digest()
+            except Exception:
+                # arguments that cannot be pickled are never cached
+                return fn(*args, **kwargs)
+            blob = self.entries.get(key)
+            if blob is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return pickle.loads(blob)
+            self.misses += 1
+            result = fn(*args, **kwargs)
+            try:
+                self.entries[key] = pickle.dumps(result, 4)
+            except Exception:
+                return result
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            return result
+
+        return memoized
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+_memo = _Memo(int(os.environ.get("NEPHELAIIO_PLUGINS_MEMOIZE_SIZE", 256)))
+
+# filters whose work outweighs pickling their arguments and unpickling
+# their result; cheap per record filters are slower through the cache
+_MEMOIZED_FILTERS = (
+    "ip_range",
+    "reverse_zones",
+    "map_flatten",
+    "to_kv",
+)
+
+
+def memoize_stats():
+    return _memo.stats()
+
+
+class _Profiler(object):
+    """
+    Per callable call counts, latencies and input sizes, written as a
+    json or csv report to a directory when the process exits. The test
+    plugin carries a reduced copy writing the same report fields
+    """
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.calls = {}
+        self.registered = False
+
+    def wrap(self, name, fn):
+        import array
+
+        timings, sizes = self.calls.setdefault(name, (array.array("d"), []))
+
+        @functools.wraps(fn)
+        def profiled(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings.append(time.perf_counter() - start)
+                sizes.append(_input_size(args[0]) if args else 0)
+
+        return profiled
+
+    def stats(self):
+        stats = []
+        for name, (timings, sizes) in sorted(self.calls.items()):
+            if not timings:
+                continue
+            ordered = sorted(timings)
+            stats.append(
+                {
+                    "plugin": self.plugin,
+                    "name": name,
+                    "calls": len(timings),
+                    "total_s": sum(timings),
+                    "mean_s": sum(timings) / len(timings),
+                    "p50_s": _percentile(ordered, 50),
+                    "p90_s": _percentile(ordered, 90),
+                    "p99_s": _percentile(ordered, 99),
+                    "max_s": ordered[-1],
+                    "input_size_total": sum(sizes),
+                    "input_size_max": max(sizes),
+                }
+            )
+        return stats
+
+    def register(self, directory, fmt="json"):
+        import atexit
+        import multiprocessing.util
+
+        if self.registered:
+            return
+        self.registered = True
+        self.directory, self.fmt = directory, fmt
+        atexit.register(self.report)
+        self._finalize()
+        multiprocessing.util.register_after_fork(self, _Profiler._after_fork)
+
+    def _finalize(self):
+        import multiprocessing.util
+
+        # forked ansible workers exit through multiprocessing, not atexit
+        multiprocessing.util.Finalize(None, self.report, exitpriority=10)
+
+    def _after_fork(self):
+        self._reset()
+        self._finalize()
+
+    def _reset(self):
+        for timings, sizes in self.calls.values():
+            del timings[:]
+            del sizes[:]
+
+    def report(self):
+        import csv
+        import json
+
+        stats = self.stats()
+        if not stats:
+            return
+        path = os.path.join(
+            self.directory, "{0}-{1}.{2}".format(self.plugin, os.getpid(), self.fmt)
+        )
+        with open(path, "w") as f:
+            if self.fmt == "csv":
+                writer = csv.DictWriter(f, fieldnames=list(stats[0]))
+                writer.writeheader()
+                writer.writerows(stats)
+            else:
+                json.dump(stats, f, indent=2)
+        self._reset()
+
+
+def _input_size(x):
+    try:
+        return len(x)
+    except TypeError:
+        return 1
+
+
+def _percentile(ordered, pct):
+    return ordered[max(0, -(-len(ordered) * pct // 100) - 1)]
+
+
+_profiler = _Profiler("filters")
+
+
+def profile_stats():
+    return _profiler.stats()
 
 
 class FilterModule(object):
     """jinja2 filters"""
 
     def filters(self):
-        return {
+        filters = {
             "split_with": split_with,
             "join_with": join_with,
             "head": head,
             "tail": tail,
             "map_format": map_format,
+            "map_format_list": map_format_list,
             "map_values": map_values,
             "reverse_record": reverse_record,
+            "iter_reverse_records": iter_reverse_records,
+            "reverse_zones": reverse_zones,
             "zone_fwd": zone_fwd,
+            "zones_fwd": zones_fwd,
+            "iter_zones_conf": iter_zones_conf,
+            "zones_conf": zones_conf,
             "alias_keys": alias_keys,
             "merge_dicts": merge_dicts,
             "map_attributes": map_attributes,
             "drop_attributes": drop_attributes,
             "select_attributes": select_attributes,
+            "project": project,
+            "sort_records": sort_records,
             "merge_dicts_reverse": merge_dicts_reverse,
+            "deep_merge": deep_merge,
             "to_dict": to_dict,
             "merge_item": merge_item,
             "key_item": key_item,
             "dict_to_list": dict_to_list,
             "list_to_dict": list_to_dict,
+            "join_records": join_records,
+            "inner_join": inner_join,
+            "left_join": left_join,
+            "anti_join": anti_join,
             "to_kv": to_kv,
+            "iter_kv": iter_kv,
             "to_safe_yaml": to_safe_yaml,
             "sorted_get": sorted_get,
             "ip_range": ip_range,
+            "ip_range_lazy": ip_range_lazy,
+            "ip_pool_next": ip_pool_next,
+            "ip_pool_free_ranges": ip_pool_free_ranges,
+            "ip_pool_utilization": ip_pool_utilization,
+            "cidr_summarize": cidr_summarize,
+            "partition_network": partition_network,
+            "map_subnet": map_subnet,
             "map_flatten": map_flatten,
+            "iter_flatten": iter_flatten,
+            "map_diff": map_diff,
             "map_join": map_join,
             "merge_join": merge_join,
             "map_group": map_group,
+            "to_table": to_table,
+            "to_records": to_records,
+            "table_select": table_select,
+            "table_project": table_project,
+            "table_filter": table_filter,
+            "table_group": table_group,
+            "table_join": table_join,
             "is_any_true": is_any_true,
             "is_all_true": is_all_true,
             "search_regex": search_regex,
+            "map_search_regex": map_search_regex,
+            "select_property": select_property,
+            "classify_regex": classify_regex,
         }
+        if os.environ.get("NEPHELAIIO_PLUGINS_MEMOIZE", "").lower() in (
+            "1",
+            "true",
+            "yes",
+        ):
+            for name in _MEMOIZED_FILTERS:
+                filters[name] = _memo.wrap(name, filters[name])
+        profile = os.environ.get("NEPHELAIIO_PLUGINS_PROFILE")
+        if profile:
+            fmt = os.environ.get("NEPHELAIIO_PLUGINS_PROFILE_FORMAT", "json")
+            _profiler.register(profile, fmt)
+            filters = {name: _profiler.wrap(name, fn) for name, fn in filters.items()}
+        return filters
@@ -1,5 +1,7 @@
 import sys
 import os
+import itertools
+import json
 import pytest
 
 sys.path.append(os.path.join(os.path.dirname(sys.path[0]), "filter_plugins"))
@@ -9,35 +11,73 @@ print(sys.path)
 
 from custom_filters import (  # noqa: E402
     reverse_record,
+    reverse_zones,
+    zone_fwd,
+    zones_fwd,
+    zones_conf,
+    iter_zones_conf,
+    iter_reverse_records,
     filename,
     with_ext,
     alias_keys,
     merge_dicts,
     merge_dicts_reverse,
+    deep_merge,
     select_attributes,
     drop_attributes,
     map_format,
+    map_format_list,
     merge_item,
     key_item,
     dict_to_list,
     list_to_dict,
+    join_records,
+    inner_join,
+    left_join,
+    anti_join,
     is_hash,
     to_dict,
     to_kv,
+    iter_kv,
     to_safe_yaml,
     map_values,
     map_attributes,
+    project,
+    sort_records,
     sorted_get,
     ip_range,
+    ip_range_lazy,
+    ip_pool_next,
+    ip_pool_free_ranges,
+    ip_pool_utilization,
+    cidr_summarize,
+    partition_network,
+    map_subnet,
     map_flatten,
+    iter_flatten,
+    map_diff,
     map_join,
     merge_join,
     map_group,
+    to_table,
+    to_records,
+    table_select,
+    table_project,
+    table_filter,
+    table_group,
+    table_join,
     is_any_true,
     is_all_true,
-    search_regex
+    search_regex,
+    map_search_regex,
+    select_property,
+    regex_cache_info,
+    classify_regex,
+    memoize_stats,
+    profile_stats,
+    FilterModule,
 )
-from custom_tests import test_network, test_property  # noqa: E402
+from custom_tests import test_network, test_property, _compile_network  # noqa: E402
 
 
 def test_is_hash():
@@ -57,6 +97,93 @@ def test_reverse_record():
     assert rr["type"] == "PTR"
 
 
+def test_reverse_record_ipv6():
+    rr = reverse_record({"host": "test.com", "ip-address": "2001:db8::1"})
+    assert rr["host"] == ".".join(["1"] + ["0"] * 23 + list("8bd01002")) + ".ip6.arpa"
+    assert rr["ip-address"] == "test.com"
+
+
+def test_reverse_zones():
+    records = [
+        {"host": "c.com", "ip-address": "10.0.1.1"},
+        {"host": "b.com", "ip-address": "10.0.0.20"},
+        {"host": "a.com", "ip-address": "10.0.0.3"},
+        {"host": "v6.com", "ip-address": "2001:db8::1"},
+    ]
+    zones = reverse_zones(records)
+    assert [z["zone"] for z in zones] == [
+        "0.0.10.in-addr.arpa",
+        "1.0.10.in-addr.arpa",
+        "0.0.0.0.0.0.0.0.8.b.d.0.1.0.0.2.ip6.arpa",
+    ]
+    assert zones[0]["records"] == [
+        reverse_record(records[2]),
+        reverse_record(records[1]),
+    ]
+    assert zones[1]["records"] == [reverse_record(records[0])]
+    assert zones[2]["records"] == [reverse_record(records[3])]
+
+    assert [z["zone"] for z in reverse_zones(records, 16, 32)] == [
+        "0.10.in-addr.arpa",
+        "8.b.d.0.1.0.0.2.ip6.arpa",
+    ]
+    assert [z["zone"] for z in reverse_zones(records[:1], 8)] == ["10.in-addr.arpa"]
+    assert reverse_zones([]) == []
+
+    ptrs = iter_reverse_records(records)
+    assert next(ptrs) == {"zone": "0.0.10.in-addr.arpa", **reverse_record(records[2])}
+
+    with pytest.raises(ValueError):
+        reverse_zones(records, 12)
+    with pytest.raises(ValueError):
+        reverse_zones(records, 24, 66)
+
+
+def test_zones_fwd():
+    zones = [
+        {"zone": "b.com", "forwarders": ["10.0.0.1", "10.0.0.2"]},
+        {"network": "10.0.0.0/23", "forwarders": ["10.0.0.1"]},
+        {"zone": "a.com", "forwarders": ["10.0.0.3"], "forward": "first"},
+        {"network": "2001:db8::/64", "forwarders": ["::1"]},
+        {"zone": "b.com", "forwarders": ["10.0.0.4"]},
+    ]
+    rev6 = "0.0.0.0.0.0.0.0.8.b.d.0.1.0.0.2.ip6.arpa"
+    expected = {}
+    for zone, servers in [
+        ("a.com", ["10.0.0.3"]),
+        ("b.com", ["10.0.0.4"]),
+        ("0.0.10.in-addr.arpa", ["10.0.0.1"]),
+        ("1.0.10.in-addr.arpa", ["10.0.0.1"]),
+        (rev6, ["::1"]),
+    ]:
+        expected.update(zone_fwd(zone, servers))
+    expected['zone "a.com" IN']["forward"] = "first"
+    result = zones_fwd(zones)
+    assert result == expected
+    assert list(result) == list(expected)
+    assert list(zones_fwd(zones[::-1][1:] + zones[-1:])) == list(expected)
+    assert list(zones_fwd([{"network": "10.1.2.0/28", "forwarders": []}])) == [
+        'zone "2.1.10.in-addr.arpa" IN'
+    ]
+    assert list(zones_fwd([{"network": "10.0.0.0/7", "forwarders": []}])) == [
+        'zone "10.in-addr.arpa" IN',
+        'zone "11.in-addr.arpa" IN',
+    ]
+
+    conf = zones_conf(zones)
+    assert conf == "".join(iter_zones_conf(zones))
+    assert conf.startswith(
+        'zone "a.com" IN {\n'
+        "    type forward;\n"
+        "    forward first;\n"
+        "    forwarders { 10.0.0.3; };\n"
+        "};\n"
+        'zone "b.com" IN {\n'
+    )
+    assert conf.count("zone ") == 5
+    assert zones_conf([]) == ""
+
+
 def test_filename():
     assert filename("basename.ext") == "basename"
     assert filename("basename.ext1.ext2") == "basename"
@@ -77,6 +204,13 @@ def test_test_network():
     assert not test_network(r, "10.0.0.0/24")
     assert not test_network(r, "10.1.0.0/24")
     assert test_network(r, "10.0.0.0/24", "address") == r
+    assert not test_network(r, "::/0", "address")
+    assert test_network({"address": "2001:db8::1"}, "2001:db8::/64", "address")
+    _compile_network.cache_clear()
+    for _ in range(3):
+        test_network(r, "10.0.0.0/24", "address")
+    assert _compile_network.cache_info().hits == 2
+    assert _compile_network.cache_info().misses == 1
 
 
 def test_test_property():
@@ -122,6 +256,69 @@ def test_merge_dicts_reverse():
     assert merge_dicts_reverse({"a": "0", "b": "1"}, {"a": "2"}) == {"a": "0", "b": "1"}
 
 
+def test_deep_merge():
+    assert deep_merge([]) == {}
+    assert deep_merge([{"a": 1}]) == {"a": 1}
+    assert deep_merge(iter([{"a": 1}, {"b": 2}])) == {"a": 1, "b": 2}
+    assert deep_merge([{"a": 1}, {"b": 2}, {"a": 3}]) == {"a": 3, "b": 2}
+    assert deep_merge([{"a": {"b": 1, "c": 1}}, {"a": {"c": 2, "d": 2}}]) == {
+        "a": {"b": 1, "c": 2, "d": 2}
+    }
+    assert deep_merge([{"a": {"b": 1}}, {"a": 2}]) == {"a": 2}
+    assert deep_merge([{"a": {"b": 1}}, {"a": 2}, {"a": {"c": 3}}]) == {
+        "a": {"c": 3}
+    }
+
+    shared = {"x": [1, 2], "y": {"z": 1}}
+    base = {"only_base": shared, "both": {"a": 1}}
+    merged = deep_merge([base, {"both": {"b": 2}}])
+    assert merged["only_base"] is shared
+    assert merged["both"] == {"a": 1, "b": 2}
+    assert base == {"only_base": shared, "both": {"a": 1}}
+
+    layers = [{"l": [1, 2]}, {"l": [2, 3]}, {"l": [3, 4]}]
+    assert deep_merge(layers) == {"l": [3, 4]}
+    assert deep_merge(layers, "append") == {"l": [1, 2, 2, 3, 3, 4]}
+    assert deep_merge(layers, "unique") == {"l": [1, 2, 3, 4]}
+    assert deep_merge([{"l": [{"a": 1}]}, {"l": [{"a": 1}, {"b": 2}]}], "unique") == {
+        "l": [{"a": 1}, {"b": 2}]
+    }
+
+    users = [
+        {"users": [{"name": "a", "uid": 1}, {"name": "b", "uid": 2}, "raw"]},
+        {"users": [{"name": "b", "shell": "zsh"}, {"name": "c", "uid": 3}]},
+    ]
+    assert deep_merge(users, "merge", "name") == {
+        "users": [
+            {"name": "a", "uid": 1},
+            {"name": "b", "uid": 2, "shell": "zsh"},
+            "raw",
+            {"name": "c", "uid": 3},
+        ]
+    }
+
+    depth = sys.getrecursionlimit() + 100
+    layers = []
+    for name in ("a", "b"):
+        layer = leaf = {}
+        for _ in range(depth):
+            leaf["n"] = {}
+            leaf = leaf["n"]
+        leaf[name] = 1
+        layers.append(layer)
+    node = deep_merge(layers)
+    for _ in range(depth):
+        node = node["n"]
+    assert node == {"a": 1, "b": 1}
+
+    with pytest.raises(ValueError):
+        deep_merge([{"a": 1}], "prepend")
+    with pytest.raises(ValueError):
+        deep_merge([{"a": 1}], "merge")
+    with pytest.raises(ValueError):
+        deep_merge([{"a": 1}, ["b"]])
+
+
 def test_map_attributes():
     assert map_attributes({"a": "0", "b": "1"}, ["a"]) == ["0"]
     assert map_attributes({"a": "0", "b": "1"}, []) == []
@@ -131,6 +328,116 @@ def test_map_attributes():
     assert map_attributes({"a": "0"}, ["a", "b"]) == ["0"]
 
 
+def test_project():
+    records = [
+        {"name": "a", "facts": {"os": "ubuntu", "ips": ["10.0.0.1"]}, "x": 1},
+        {"name": "b", "facts": {"os": "debian", "ips": []}},
+        {"facts.os": "literal"},
+    ]
+    assert project(records, ["name", "x"]) == [
+        {"name": "a", "x": 1},
+        {"name": "b"},
+        {},
+    ]
+    assert project(records, ["name", "facts.os", "facts.ips.0"]) == [
+        {"name": "a", "facts.os": "ubuntu", "facts.ips.0": "10.0.0.1"},
+        {"name": "b", "facts.os": "debian"},
+        {"facts.os": "literal"},
+    ]
+    assert project(records, [["facts.os", "os"], "name"]) == [
+        {"os": "ubuntu", "name": "a"},
+        {"os": "debian", "name": "b"},
+        {"os": "literal"},
+    ]
+    assert project(records, {"host": "name", "ip": "facts.ips.0"}) == [
+        {"host": "a", "ip": "10.0.0.1"},
+        {"host": "b"},
+        {},
+    ]
+    assert project(records, ["x", "name"], values=True) == [[1, "a"], ["b"], []]
+    assert project([], ["name"]) == []
+    assert map_attributes(records[0], ["facts.os", "name"]) == ["ubuntu", "a"]
+    assert select_attributes(records[0], ["x", "name", "facts.os"]) == {
+        "name": "a",
+        "x": 1,
+        "facts.os": "ubuntu",
+    }
+    assert list(select_attributes(records[0], ["x", "name"])) == ["name", "x"]
+    assert select_attributes({"a": 1, "x": 9}, {"a": "x"}) == {"a": 1}
+    assert select_attributes({"a": 1, "b": 2}, [("a", "b")]) == {}
+    assert map_attributes({"a": 1, "b": 2}, [("a", "b")]) == []
+
+
+def test_sort_records():
+    hosts = [
+        {"name": "web10", "ansible_host": "10.0.0.10", "site": "b", "mem": 4},
+        {"name": "web9", "ansible_host": "10.0.0.9", "site": "a", "mem": 8},
+        {"name": "web100", "ansible_host": "10.0.0.100", "site": "a", "mem": 4},
+        {"name": "db1", "site": "b", "mem": 8, "facts": {"v": "1.10.0"}},
+        {"name": "db2", "ansible_host": "2001:db8::1", "facts": {"v": "1.9.2"}},
+    ]
+
+    def names(records):
+        return [x["name"] for x in records]
+
+    assert names(sort_records(hosts, "name")) == [
+        "db1",
+        "db2",
+        "web10",
+        "web100",
+        "web9",
+    ]
+    assert names(sort_records(hosts, "name:natural")) == [
+        "db1",
+        "db2",
+        "web9",
+        "web10",
+        "web100",
+    ]
+    assert names(sort_records(hosts, "ansible_host:ip")) == [
+        "web9",
+        "web10",
+        "web100",
+        "db2",
+        "db1",
+    ]
+    assert names(sort_records(hosts, "-ansible_host:ip")) == [
+        "db2",
+        "web100",
+        "web10",
+        "web9",
+        "db1",
+    ]
+    assert names(sort_records(hosts, ["site", "-mem", "name:natural"])) == [
+        "web9",
+        "web100",
+        "db1",
+        "web10",
+        "db2",
+    ]
+    assert names(sort_records(hosts, ["-site", "mem"])) == [
+        "web10",
+        "db1",
+        "web100",
+        "web9",
+        "db2",
+    ]
+    assert names(sort_records(hosts, ["site", "mem"], reverse=True)) == [
+        "db1",
+        "web10",
+        "web9",
+        "web100",
+        "db2",
+    ]
+    assert names(
+        sort_records(hosts, {"attribute": "facts.v", "type": "version", "reverse": 1})
+    ) == ["db1", "db2", "web10", "web9", "web100"]
+    assert sort_records([], "name") == []
+
+    with pytest.raises(ValueError):
+        sort_records(hosts, {"attribute": "name", "type": "roman"})
+
+
 def test_select_attributes():
     assert select_attributes({"a": "0", "b": "1"}, ["a"]) == {"a": "0"}
     assert select_attributes({"a": "0", "b": "1"}, []) == {}
@@ -145,6 +452,27 @@ def test_drop_attributes():
     assert drop_attributes({"a": "0"}, ["c"]) == {"a": "0"}
 
 
+def test_record_copies():
+    nested = {"facts": {"interfaces": ["eth0"]}}
+    d = {"a": 1, "b": nested}
+
+    shallow = drop_attributes(d, ["a"])
+    assert shallow == {"b": nested}
+    assert shallow["b"] is nested
+    deep = drop_attributes(d, ["a"], deep=True)
+    assert deep == {"b": nested}
+    assert deep["b"] is not nested
+
+    assert alias_keys(d, {"a": "c"})["b"] is nested
+    assert alias_keys(d, {"a": "c"}, deep=True)["b"] is not nested
+    assert key_item(d, "a")[1]["b"] is nested
+    assert key_item(d, "a", deep=True)[1]["b"] is not nested
+    assert list_to_dict([d], "a")[1]["b"] is nested
+    assert list_to_dict([d], "a", deep=True)[1]["b"] is not nested
+
+    assert d == {"a": 1, "b": {"facts": {"interfaces": ["eth0"]}}}
+
+
 def test_to_dict():
     assert to_dict([["a", "b"]]) == {"a": "b"}
     assert to_dict({"a": "b"}, "c") == {"c": {"a": "b"}}
@@ -164,6 +492,36 @@ def test_map_format():
     assert map_format({"a": "first"}, {"a": "x%s"}) == {"a": "xfirst"}
     assert map_format({"a": "first"}, {"a": "%sx"}) == {"a": "firstx"}
     assert map_format({"a": "first"}, {"a": "second"}) == {"a": "second"}
+    assert map_format(("a", "b"), "%s-%s") == "a-b"
+    assert map_format(("a", "b"), "%s") == "%s"
+    pattern = {"a": "x%s", "b": {"c": "%s!"}}
+    assert map_format({"a": "1", "b": {"c": "2"}}, pattern) == {
+        "a": "x1",
+        "b": {"c": "2!"},
+    }
+    pattern["b"]["c"] = "%s?"
+    assert map_format({"a": "1", "b": {"c": "2"}}, pattern) == {
+        "a": "x1",
+        "b": {"c": "2?"},
+    }
+
+
+def test_map_format_list():
+    assert map_format_list([], "%sx") == []
+    assert map_format_list(["a", "b"], "%sx") == ["ax", "bx"]
+    assert map_format_list([("a", "b"), "c"], "%s-%s") == ["a-b", "%s-%s"]
+    pattern = {"a": "x%s", "b": {"c": "%s!"}}
+    values = [{"a": "1", "b": {"c": "2", "d": "3"}}, {"e": "4"}, "f"]
+    assert map_format_list(values, pattern) == [map_format(v, pattern) for v in values]
+    assert map_format_list(values, pattern) == [
+        {"a": "x1", "b": {"c": "2!", "d": "3"}},
+        {"e": "4"},
+        pattern,
+    ]
+    fallback = map_format("f", pattern)
+    fallback["a"] = "changed"
+    assert map_format("f", pattern) == pattern
+    assert map_format_list(["a"], ["%s"]) == ["['a']"]
 
 
 def test_map_values():
@@ -202,6 +560,54 @@ def test_list_to_dict():
     }
 
 
+def test_join_records():
+    hosts = [
+        {"name": "a", "site": "dc1"},
+        {"name": "b", "site": "dc2"},
+        {"name": "c", "site": "dc1"},
+        {"site": "dc3"},
+    ]
+    ipam = [
+        {"name": "c", "ip": "10.0.0.3"},
+        {"name": "a", "ip": "10.0.0.1"},
+        {"name": "a", "ip": "10.0.0.11"},
+    ]
+    assert inner_join(hosts, ipam, "name") == [
+        {"name": "a", "site": "dc1", "ip": "10.0.0.1"},
+        {"name": "a", "site": "dc1", "ip": "10.0.0.11"},
+        {"name": "c", "site": "dc1", "ip": "10.0.0.3"},
+    ]
+    assert inner_join(hosts, ipam, "name", duplicates="first")[0]["ip"] == "10.0.0.1"
+    assert inner_join(hosts, ipam, "name", duplicates="last")[0]["ip"] == "10.0.0.11"
+    assert left_join(hosts, ipam, "name", duplicates="last") == [
+        {"name": "a", "site": "dc1", "ip": "10.0.0.11"},
+        {"name": "b", "site": "dc2"},
+        {"name": "c", "site": "dc1", "ip": "10.0.0.3"},
+        {"site": "dc3"},
+    ]
+    assert anti_join(hosts, ipam, "name") == [hosts[1], hosts[3]]
+    with pytest.raises(ValueError):
+        inner_join(hosts, ipam, "name", duplicates="error")
+    for extra in ([], [{"k": 4}, {"k": 5}]):
+        right = [{"k": 3}, {"k": 3}] + extra
+        with pytest.raises(ValueError):
+            inner_join([{"k": 1}, {"k": 2}], right, "k", duplicates="error")
+    with pytest.raises(ValueError):
+        join_records(hosts, ipam, "name", how="outer")
+
+    # smaller left side is indexed instead, output still follows left order
+    assert inner_join(hosts[:1], ipam * 3, "name", duplicates="first") == [
+        {"name": "a", "site": "dc1", "ip": "10.0.0.1"},
+    ]
+    assert anti_join(hosts[:2], ipam * 3, "name") == [hosts[1]]
+
+    vlans = [{"vlan_site": "dc1", "vlan_name": "c", "vlan": 10}]
+    assert inner_join(hosts, vlans, ["site", "name"], ["vlan_site", "vlan_name"]) == [
+        {"name": "c", "site": "dc1", "vlan_site": "dc1", "vlan_name": "c", "vlan": 10},
+    ]
+    assert left_join([], ipam, "name") == []
+
+
 def test_to_kv():
     assert to_kv(1) == [{"key": "", "value": 1}]
     assert to_kv(["a"]) == [{"key": "0", "value": "a"}]
@@ -246,11 +652,78 @@ def test_to_kv():
     ]
 
 
+def test_iter_kv():
+    target = {"a": {"b": {"c": "d"}, "e": ["f", "g"]}, "h": "i"}
+    assert list(iter_kv(target)) == to_kv(target)
+    assert list(iter_kv(target, max_items=2)) == [
+        {"key": "a.b.c", "value": "d"},
+        {"key": "a.e.0", "value": "f"},
+    ]
+    assert list(iter_kv(target, max_items=0)) == []
+    assert list(iter_kv(target, max_depth=1)) == [
+        {"key": "a", "value": {"b": {"c": "d"}, "e": ["f", "g"]}},
+        {"key": "h", "value": "i"},
+    ]
+    assert list(iter_kv(target, sep="/", max_depth=2)) == [
+        {"key": "a/b", "value": {"c": "d"}},
+        {"key": "a/e", "value": ["f", "g"]},
+        {"key": "h", "value": "i"},
+    ]
+    assert list(iter_kv(target, prefix="p", max_depth=0)) == [
+        {"key": "p", "value": target}
+    ]
+
+
+def test_to_kv_deep():
+    target = "leaf"
+    for _ in range(sys.getrecursionlimit() + 100):
+        target = {"a": target}
+    kv = to_kv(target, sep="")
+    assert kv == [{"key": "a" * (sys.getrecursionlimit() + 100), "value": "leaf"}]
+
+
 def test_to_safe_yaml():
     assert to_safe_yaml([{"a": 0}, {"b": 1}]) == "- a: 0\n- b: 1\n"
     assert to_safe_yaml({"a": 0}) == "a: 0\n"
     assert to_safe_yaml({"a": [0, 1]}) == "a:\n- 0\n- 1\n"
     assert to_safe_yaml({"a": 0, "b": 1}) == "a: 0\nb: 1\n"
+    assert to_safe_yaml({"a": {"b": [0]}}, indent=4) == "a:\n    b:\n    - 0\n"
+
+
+def test_to_safe_yaml_dumper():
+    import yaml
+
+    target = {
+        "hosts": [
+            {"name": "h{0}".format(i), "vars": {"x": i, "y": None}} for i in range(50)
+        ],
+        "text": "multi\nline",
+        "unicode": "caf\u00e9",
+        "empty": {},
+    }
+    assert to_safe_yaml(target) == yaml.safe_dump(target)
+    for edge in ("x", 1, {"": 1}, {"k" * 129: 1}):
+        assert to_safe_yaml(edge) == yaml.safe_dump(edge)
+    assert to_safe_yaml("x") == "x\n...\n"
+    assert to_safe_yaml({"": 1}) == "? ''\n: 1\n"
+
+
+def test_to_safe_yaml_libyaml(monkeypatch):
+    import yaml
+
+    monkeypatch.setenv("NEPHELAIIO_PLUGINS_YAML_LIBYAML", "1")
+    target = {"hosts": [{"name": "a", "vars": {"x": 1}}], "text": "multi\nline"}
+    assert to_safe_yaml(target) == yaml.safe_dump(target)
+    if hasattr(yaml, "CSafeDumper"):
+        assert to_safe_yaml("x") == "x\n"
+
+
+def test_to_safe_yaml_dest(tmp_path):
+    dest = str(tmp_path / "out.yml")
+    target = {"a": [0, 1], "b": {"c": "d"}}
+    assert to_safe_yaml(target, dest=dest) == dest
+    with open(dest) as f:
+        assert f.read() == to_safe_yaml(target)
 
 
 def test_sorted_get():
@@ -285,6 +758,143 @@ def test_sorted_get():
 def test_iprange():
     assert ip_range("8.8.8.8") == ["8.8.8.8"]
     assert ip_range("8.8.8.8-8.8.8.10") == ["8.8.8.8", "8.8.8.9", "8.8.8.10"]
+    assert ip_range("8.8.8.10-8.8.8.8") == []
+    assert list(ip_range("10.0.0.0/30")) == [
+        "10.0.0.0",
+        "10.0.0.1",
+        "10.0.0.2",
+        "10.0.0.3",
+    ]
+    assert ip_range("2001:db8::1-2001:db8::2") == ["2001:db8::1", "2001:db8::2"]
+    assert ip_range("10.0.0.1, 10.0.1.0/31") == ["10.0.0.1", "10.0.1.0", "10.0.1.1"]
+
+    assert isinstance(ip_range("10.0.0.1"), list)
+    assert json.dumps(ip_range("10.0.0.1-10.0.0.2")) == '["10.0.0.1", "10.0.0.2"]'
+
+    r = ip_range_lazy("10.0.0.0-10.255.255.255")
+    assert len(r) == 2 ** 24
+    assert r[0] == "10.0.0.0"
+    assert r[-1] == "10.255.255.255"
+    assert r[256] == "10.0.1.0"
+    assert r[1:3] == ["10.0.0.1", "10.0.0.2"]
+    assert len(r[1:]) == 2 ** 24 - 1
+    assert r[:6:2] == ["10.0.0.0", "10.0.0.2", "10.0.0.4"]
+    assert "10.1.2.3" in r
+    assert "11.0.0.0" not in r
+    assert "garbage" not in r
+    assert "::a00:1" not in r
+    with pytest.raises(IndexError):
+        r[2 ** 24]
+
+    multi = ip_range_lazy("10.0.0.1-10.0.0.2,10.0.1.1")
+    assert multi[2] == "10.0.1.1"
+    assert multi[1:] == ["10.0.0.2", "10.0.1.1"]
+    assert str(multi) == "['10.0.0.1', '10.0.0.2', '10.0.1.1']"
+    assert to_safe_yaml(multi) == "- 10.0.0.1\n- 10.0.0.2\n- 10.0.1.1\n"
+    assert multi + ["a"] == ["10.0.0.1", "10.0.0.2", "10.0.1.1", "a"]
+    assert ["a"] + multi == ["a", "10.0.0.1", "10.0.0.2", "10.0.1.1"]
+    assert multi == ip_range("10.0.0.1-10.0.0.2,10.0.1.1")
+
+    with pytest.raises(TypeError):
+        ip_range("10.0.0.1-::1")
+
+
+def test_ip_pool():
+    pool = "10.0.0.0/29"
+    used = ["10.0.0.0", "10.0.0.2-10.0.0.4", "10.0.0.7", "192.168.0.1"]
+    assert ip_pool_next(pool, used) == ["10.0.0.1"]
+    assert ip_pool_next(pool, used, 3) == ["10.0.0.1", "10.0.0.5", "10.0.0.6"]
+    assert ip_pool_next(pool, used, 10) == ["10.0.0.1", "10.0.0.5", "10.0.0.6"]
+    assert ip_pool_next(pool) == ["10.0.0.0"]
+    assert ip_pool_next("10.0.0.1", "10.0.0.1") == []
+    assert ip_pool_free_ranges(pool, used) == ["10.0.0.1", "10.0.0.5-10.0.0.6"]
+    assert ip_pool_free_ranges("10.0.0.1-10.0.0.3,10.0.0.2-10.0.0.9", []) == [
+        "10.0.0.1-10.0.0.9"
+    ]
+    assert ip_pool_utilization(pool, used) == {
+        "size": 8,
+        "used": 5,
+        "free": 3,
+        "utilization": 0.625,
+    }
+    assert ip_pool_utilization("10.0.0.0/8", ["10.0.0.1"])["free"] == 2 ** 24 - 1
+    assert ip_pool_next("2001:db8::/64", ["2001:db8::-2001:db8::ff"], 2) == [
+        "2001:db8::100",
+        "2001:db8::101",
+    ]
+
+
+def test_cidr_summarize():
+    assert cidr_summarize([]) == []
+    assert cidr_summarize("10.0.0.1") == ["10.0.0.1/32"]
+    assert cidr_summarize(["10.0.0.1", "10.0.0.0", "10.0.0.3", "10.0.0.2"]) == [
+        "10.0.0.0/30"
+    ]
+    assert cidr_summarize(["10.0.0.1-10.0.0.6"]) == [
+        "10.0.0.1/32",
+        "10.0.0.2/31",
+        "10.0.0.4/31",
+        "10.0.0.6/32",
+    ]
+    assert cidr_summarize(["10.0.0.0/25", "10.0.0.128/25", "10.0.0.5"]) == [
+        "10.0.0.0/24"
+    ]
+    assert cidr_summarize("10.0.1.0/24,10.0.0.0-10.0.0.255,2001:db8::/65") == [
+        "10.0.0.0/23",
+        "2001:db8::/65",
+    ]
+    assert cidr_summarize(["2001:db8::1", "2001:db8::"]) == ["2001:db8::/127"]
+    assert cidr_summarize("0.0.0.0-255.255.255.255") == ["0.0.0.0/0"]
+
+
+def test_partition_network():
+    hosts = [
+        {"name": "a", "ansible_host": "10.0.0.1"},
+        {"name": "b", "ansible_host": "10.1.0.1"},
+        {"name": "c"},
+        {"name": "d", "ansible_host": "192.168.0.1"},
+    ]
+    assert partition_network(hosts, "10.0.0.0/16") == [
+        [hosts[0]],
+        [hosts[1], hosts[2], hosts[3]],
+    ]
+    assert partition_network(hosts, ["10.0.0.0/8", "192.168.0.0/24"]) == [
+        [hosts[0], hosts[1], hosts[3]],
+        [hosts[2]],
+    ]
+    assert partition_network(hosts, "::/0") == [[], hosts]
+    assert partition_network([], "10.0.0.0/8") == [[], []]
+
+
+def test_map_subnet():
+    hosts = [
+        {"name": "a", "ansible_host": "10.0.0.1"},
+        {"name": "b", "ansible_host": "10.0.1.1"},
+        {"name": "c", "ansible_host": "192.168.0.1"},
+        {"name": "d", "ansible_host": "2001:db8::1"},
+        {"name": "e"},
+    ]
+    subnets = ["10.0.0.0/8", "10.0.0.0/24", "2001:db8::/32", "2001:db8::/64"]
+    assert [x["subnet"] for x in map_subnet(hosts, subnets)] == [
+        "10.0.0.0/24",
+        "10.0.0.0/8",
+        None,
+        "2001:db8::/64",
+        None,
+    ]
+    assert map_subnet(hosts[:1], subnets, attr="net") == [
+        {"name": "a", "ansible_host": "10.0.0.1", "net": "10.0.0.0/24"},
+    ]
+    assert "subnet" not in hosts[0]
+
+    sites = {"10.0.0.0/16": {"site": "dc1"}, "0.0.0.0/0": {"site": "any"}}
+    assert [(x["subnet"], x["subnet_meta"]) for x in map_subnet(hosts, sites)] == [
+        ("10.0.0.0/16", {"site": "dc1"}),
+        ("10.0.0.0/16", {"site": "dc1"}),
+        ("0.0.0.0/0", {"site": "any"}),
+        (None, None),
+        (None, None),
+    ]
 
 
 def test_map_flatten():
@@ -317,6 +927,52 @@ def test_map_flatten():
         map_flatten(["a", "b"])
 
 
+def test_iter_flatten():
+    target = {"a": [{"b": 1, "c": 2}, {"d": 3}], "e": ["f", "g"], "h": {}}
+    assert list(iter_flatten(target)) == list(map_flatten(target).items())
+    assert list(itertools.islice(iter_flatten(target), 2)) == [
+        ("a.0.b", 1),
+        ("a.0.c", 2),
+    ]
+    assert list(iter_flatten({"a": 1}, "x")) == [("x.a", 1)]
+
+    with pytest.raises(ValueError):
+        iter_flatten(["a", "b"])
+
+
+def test_map_flatten_deep():
+    target = {}
+    node = target
+    for _ in range(sys.getrecursionlimit() + 100):
+        node["a"] = {}
+        node = node["a"]
+    node["b"] = 1
+    flattened = map_flatten(target)
+    assert len(flattened) == 1
+    assert list(flattened.values()) == [1]
+
+
+def test_map_diff():
+    shared = {"big": list(range(10))}
+    old = {"a": {"b": 1, "c": [1, 2]}, "d": "x", "s": shared, "t": {"u": 1}}
+    new = {"a": {"b": 2, "c": [1]}, "e": {"f": 1}, "s": shared, "t": 5}
+    assert map_diff(old, new) == [
+        {"path": "a.b", "change": "changed", "old": 1, "new": 2},
+        {"path": "a.c.1", "change": "removed", "old": 2},
+        {"path": "d", "change": "removed", "old": "x"},
+        {"path": "t.u", "change": "removed", "old": 1},
+        {"path": "t", "change": "added", "new": 5},
+        {"path": "e.f", "change": "added", "new": 1},
+    ]
+    assert map_diff(old, new, 2) == map_diff(old, new)[:2]
+    assert map_diff(old, old) == []
+    assert map_diff({}, {}) == []
+    assert map_diff({"a": {}}, {}) == []
+
+    with pytest.raises(ValueError):
+        map_diff({}, [])
+
+
 def test_map_join():
     target = {
         "a": 1,
@@ -431,6 +1087,58 @@ def test_map_group():
         },
     ]
 
+def test_map_group_aggregates():
+    target = [
+        {"site": "a", "host": "h1", "mem": 4, "os": "ubuntu"},
+        {"site": "a", "host": "h2", "mem": 8, "os": "debian"},
+        {"site": "b", "host": "h3", "mem": 2, "os": "ubuntu"},
+        {"site": "a", "host": "h4", "os": "ubuntu"},
+    ]
+    aggregates = {
+        "hosts": "count",
+        "mem_total": ["sum", "mem"],
+        "mem_min": ["min", "mem"],
+        "mem_max": ["max", "mem"],
+        "first_host": ["first", "host"],
+        "last_host": ["last", "host"],
+        "os": ["distinct", "os"],
+    }
+    assert map_group(target, ["site"], "host", aggregates) == [
+        {
+            "site": "a",
+            "host": ["h1", "h2", "h4"],
+            "hosts": 3,
+            "mem_total": 12,
+            "mem_min": 4,
+            "mem_max": 8,
+            "first_host": "h1",
+            "last_host": "h4",
+            "os": ["ubuntu", "debian"],
+        },
+        {
+            "site": "b",
+            "host": ["h3"],
+            "hosts": 1,
+            "mem_total": 2,
+            "mem_min": 2,
+            "mem_max": 2,
+            "first_host": "h3",
+            "last_host": "h3",
+            "os": ["ubuntu"],
+        },
+    ]
+    assert map_group(target, ["os"], "site", {"sites": "distinct", "n": "count"}) == [
+        {"os": "ubuntu", "site": ["a", "b", "a"], "sites": ["a", "b"], "n": 3},
+        {"os": "debian", "site": ["a"], "sites": ["a"], "n": 1},
+    ]
+    assert map_group([{"a": 1}], ["a"], None, {"m": ["max", "b"]}) == [
+        {"a": 1, "data": [{}], "m": None},
+    ]
+
+    with pytest.raises(ValueError):
+        map_group(target, ["site"], None, {"x": "median"})
+
+
 def test_is_any_true():
     assert is_any_true(['a']) == True
     assert is_any_true(['']) == False
@@ -464,3 +1172,256 @@ def test_search_regex():
     assert search_regex('^a.*', 'abcd') == True
     assert search_regex('^.*bc.*', 'abcd') == True
     assert search_regex('^.*bc.*', 'abCd') == False
+
+
+def test_regex_cache_info():
+    before = regex_cache_info()
+    search_regex("^cache-test-[0-9]+$", "cache-test-1")
+    search_regex("^cache-test-[0-9]+$", "cache-test-2")
+    after = regex_cache_info()
+    assert after["misses"] == before["misses"] + 1
+    assert after["hits"] == before["hits"] + 1
+    assert after["maxsize"] == 1024
+
+
+def test_map_search_regex():
+    assert map_search_regex([], "^a") == []
+    assert map_search_regex(["abc", "bcd", "a"], "^a") == [True, False, True]
+    assert map_search_regex(["web01", "db01"], "^(web|db)[0-9]+$") == [True, True]
+
+
+def test_select_property():
+    records = [
+        {"host": "web01.com", "address": "10.0.0.1"},
+        {"host": "db01.net"},
+        {"address": "10.0.0.3"},
+    ]
+    assert select_property(records, ".*.com", "host") == [records[0]]
+    assert select_property(records, ".*", "address") == [records[0], records[2]]
+    assert select_property(records, "nomatch", "host") == []
+    assert select_property(records, ".*", "none") == []
+
+
+def test_classify_regex():
+    hosts = ["web01", "web02", "db01", "dbweb01", "lb01", "bastion"]
+    groups = {"web": "^web[0-9]+$", "db": "^db", "any": "^[a-z]+[0-9]+$"}
+    assert classify_regex(hosts, groups) == {
+        "web": ["web01", "web02"],
+        "db": ["db01", "dbweb01"],
+        "any": ["lb01"],
+    }
+    assert classify_regex(hosts, groups, multiple=True) == {
+        "web": ["web01", "web02"],
+        "db": ["db01", "dbweb01"],
+        "any": ["web01", "web02", "db01", "dbweb01", "lb01"],
+    }
+    assert classify_regex(hosts, groups, default="ungrouped")["ungrouped"] == [
+        "bastion"
+    ]
+    assert classify_regex([], groups) == {"web": [], "db": [], "any": []}
+    for s in hosts:
+        for name, pattern in groups.items():
+            assert (s in classify_regex([s], groups, True)[name]) == search_regex(
+                pattern, s
+            )
+
+
+def test_classify_regex_fallback():
+    groups = {"double": "^(.)\\1", "named": "^(?P<x>a)", "flagged": "(?i)^B"}
+    assert classify_regex(["aab", "abc", "bcd"], groups) == {
+        "double": ["aab"],
+        "named": ["abc"],
+        "flagged": ["bcd"],
+    }
+    flagged = {"web": "^web", "ci": "(?i)^DB"}
+    assert classify_regex(["WEB01", "db01"], flagged) == {
+        "web": [],
+        "ci": ["db01"],
+    }
+    conditional = {"cond": "^(a)?(?(1)b|c)$"}
+    assert classify_regex(["ab", "c", "ac"], conditional) == {"cond": ["ab", "c"]}
+
+
+def test_record_table():
+    hosts = [
+        {"name": "a", "site": "dc1", "mem": 4, "ip": "10.0.0.1", "facts": {"os": "u"}},
+        {"name": "b", "site": "dc2", "mem": 8, "ip": "10.1.0.1"},
+        {"name": "c", "site": "dc1", "mem": 2},
+    ]
+    table = to_table(hosts)
+    assert len(table) == 3
+    assert table.columns["mem"].typecode == "q"
+    assert to_records(table) == hosts
+    assert to_records(to_table([])) == []
+    assert to_records(table_select(table, ["name", "nope"])) == [
+        {"name": "a"},
+        {"name": "b"},
+        {"name": "c"},
+    ]
+    assert to_records(table_project(table, ["name", ["facts.os", "os"]])) == project(
+        hosts, ["name", ["facts.os", "os"]]
+    )
+    assert to_records(table_filter(table, "mem", "gt", 2)) == hosts[:2]
+    assert to_records(table_filter(table, "ip", "defined")) == hosts[:2]
+    assert to_records(table_filter(table, "ip", "network", "10.0.0.0/16")) == hosts[:1]
+    assert to_records(table_filter(table, "name", "match", "^[bc]")) == hosts[1:]
+    assert to_records(table_filter(table, "nope")) == []
+    with pytest.raises(ValueError):
+        table_filter(table, "mem", "between", 2)
+    aggregates = {"n": "count", "mem": ["sum", "mem"], "names": ["distinct", "name"]}
+    assert to_records(table_group(table, ["site"], aggregates)) == [
+        {k: v for k, v in x.items() if k != "data"}
+        for x in map_group(hosts, ["site"], None, aggregates)
+    ]
+    partial = [{}, {"s": 1}, {"t": 1}, {"s": 2, "t": 3}, {"s": 2}]
+    assert to_records(table_group(to_table(partial), ["s", "t"])) == [
+        {k: v for k, v in x.items() if k != "data"}
+        for x in map_group(partial, ["s", "t"], None, {"count": "count"})
+    ]
+    assert len(table_group(to_table([{}, {"s": 1}]), ["s"])) == 2
+    racks = [{"name": "a", "rack": 1}, {"name": "a", "rack": 2}, {"name": "c", "rack": 3}]
+    for how in ("inner", "left", "anti"):
+        joined = table_join(table, to_table(racks), "name", how)
+        assert to_records(joined) == join_records(hosts, racks, "name", how)
+    assert table_join(table, to_table(racks), ["name"]).columns["rack"].typecode == "q"
+    with pytest.raises(ValueError):
+        table_join(table, table, "name", "outer")
+    for aggregates in ({"s": "sum"}, {"s": ["min"]}):
+        with pytest.raises(ValueError):
+            table_group(table, ["site"], aggregates)
+
+
+def test_memoize(monkeypatch):
+    import custom_filters
+
+    monkeypatch.delenv("NEPHELAIIO_PLUGINS_MEMOIZE", raising=False)
+    assert FilterModule().filters()["map_flatten"] is map_flatten
+
+    monkeypatch.setenv("NEPHELAIIO_PLUGINS_MEMOIZE", "1")
+    monkeypatch.setattr(custom_filters, "_memo", custom_filters._Memo(2))
+    filters = FilterModule().filters()
+    assert filters["map_flatten"] is not map_flatten
+    assert filters["head"] is custom_filters.head
+
+    flattened = filters["map_flatten"]({"a": {"b": 1}})
+    assert flattened == {"a.b": 1}
+    flattened["a.b"] = 2
+    assert filters["map_flatten"]({"a": {"b": 1}}) == {"a.b": 1}
+    assert filters["map_flatten"]({"a": {"b": True}}) == {"a.b": True}
+    assert filters["ip_range"]("10.0.0.1-10.0.0.2") == ["10.0.0.1", "10.0.0.2"]
+    r = filters["ip_range"]("10.0.0.1-10.0.0.2")
+    r.append("10.0.0.3")
+    assert filters["ip_range"]("10.0.0.1-10.0.0.2") == ["10.0.0.1", "10.0.0.2"]
+    assert filters["map_format"] is custom_filters.map_format
+    assert filters["map_flatten"]({"a": [lambda: 1]})["a.0"]() == 1
+    assert memoize_stats() == {
+        "hits": 3,
+        "misses": 3,
+        "evictions": 1,
+        "size": 2,
+        "maxsize": 2,
+    }
+
+
+def test_memoize_hit_is_cheaper():
+    import time
+    import custom_filters
+
+    memo = custom_filters._Memo(2)
+    memoized = memo.wrap("ip_range", ip_range)
+
+    def elapsed():
+        start = time.perf_counter()
+        result = memoized("10.0.0.0/18")
+        return time.perf_counter() - start, result
+
+    miss, expected = elapsed()
+    hits = [elapsed() for _ in range(3)]
+    assert memo.stats()["hits"] == 3
+    assert all(result == expected for _, result in hits)
+    assert hits[0][1] is not hits[1][1]
+    assert min(t for t, _ in hits) < miss / 2
+
+
+def test_profile(monkeypatch, tmp_path):
+    import csv
+    import custom_filters
+    import custom_tests
+
+    monkeypatch.delenv("NEPHELAIIO_PLUGINS_PROFILE", raising=False)
+    assert FilterModule().filters()["head"] is custom_filters.head
+    assert custom_tests.TestModule().tests()["test_network"] is test_network
+
+    monkeypatch.setenv("NEPHELAIIO_PLUGINS_PROFILE", str(tmp_path))
+    profiler = custom_filters._Profiler("filters")
+    monkeypatch.setattr(custom_filters, "_profiler", profiler)
+    filters = FilterModule().filters()
+    assert filters["head"]([1, 2, 3]) == 1
+    assert filters["head"]("ab") == "a"
+    assert filters["to_kv"]({"a": 1}) == [{"key": "a", "value": 1}]
+    stats = {x["name"]: x for x in profile_stats()}
+    assert set(stats) == {"head", "to_kv"}
+    assert stats["head"]["calls"] == 2
+    assert stats["head"]["input_size_total"] == 5
+    assert stats["head"]["input_size_max"] == 3
+    assert stats["head"]["p50_s"] <= stats["head"]["p99_s"] <= stats["head"]["max_s"]
+
+    profiler.report()
+    with open(str(tmp_path / "filters-{0}.json".format(os.getpid()))) as f:
+        report = json.load(f)
+    assert {x["name"] for x in report} == {"head", "to_kv"}
+    assert profile_stats() == []
+
+    monkeypatch.setenv("NEPHELAIIO_PLUGINS_PROFILE_FORMAT", "csv")
+    monkeypatch.setattr(custom_tests, "_profiler", custom_tests._Profiler("tests"))
+    tests = custom_tests.TestModule().tests()
+    assert tests["test_network"]({"ansible_host": "10.0.0.1"}, "10.0.0.0/8")
+    custom_tests._profiler.report()
+    with open(str(tmp_path / "tests-{0}.csv".format(os.getpid()))) as f:
+        rows = list(csv.DictReader(f))
+    assert [(x["name"], x["calls"]) for x in rows] == [("test_network", "1")]
+
+
+def test_profile_report_fields(tmp_path):
+    import custom_filters
+    import custom_tests
+
+    reports = {}
+    for module in (custom_filters, custom_tests):
+        profiler = module._Profiler("x")
+        profiler.register(str(tmp_path), "json")
+        profiler.wrap("f", len)([1, 2])
+        profiler.wrap("g", abs)(1)
+        reports[module.__name__] = profiler.stats()
+        profiler.report()
+        with open(str(tmp_path / "x-{0}.json".format(os.getpid()))) as f:
+            assert json.load(f) == reports[module.__name__]
+    filters, tests = reports["custom_filters"], reports["custom_tests"]
+    assert [list(x) for x in filters] == [list(x) for x in tests]
+    assert [x["input_size_total"] for x in filters] == [2, 1]
+    assert [x["input_size_total"] for x in tests] == [2, 1]
+
+
+def test_benchmark_suite(tmp_path):
+    sys.path.append(os.path.join(os.path.dirname(sys.path[0]), "benchmark"))
+    import suite
+
+    cases = suite.cases(20)
+    suite.check_coverage(cases)
+    for fn in cases.values():
+        fn()
+
+    output = str(tmp_path / "results.json")
+    assert suite.main(["--scales", "20", "--repeat", "1", "--output", output]) == 0
+    args = ["--scales", "20", "--repeat", "1", "--baseline", output]
+    assert suite.main(args + ["--threshold", "1e9"]) == 0
+    assert suite.compare({"a@1": {"best_s": 2.0}}, {"a@1": {"best_s": 1.0}}, 0.5)
+    assert not suite.compare({"a@1": {"best_s": 1.4}}, {"a@1": {"best_s": 1.0}}, 0.5)
+
+
+def test_lazy_imports():
+    sys.path.append(os.path.join(os.path.dirname(sys.path[0]), "benchmark"))
+    import startup
+
+    assert startup.probe("filters")["heavy"] == []
+    assert startup.probe("tests")["heavy"] == []
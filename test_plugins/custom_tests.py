@@ -1,16 +1,33 @@
+import os
 import re
+import time
+import functools
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_network(net):
+    from netaddr import IPNetwork
+    network = IPNetwork(net)
+    return (network.first, network.last, network.version)
+
+
+_compile_regex = functools.lru_cache(
+    maxsize=int(os.environ.get('NEPHELAIIO_PLUGINS_REGEX_CACHE_SIZE', 1024))
+)(re.compile)
 
 
 def test_network(record={}, net='0.0.0.0/0', prop='ansible_host'):
-    from netaddr import IPAddress, IPNetwork
+    from netaddr import IPAddress
     if prop in record:
-        if IPAddress(record[prop]) in IPNetwork(net):
+        first, last, version = _compile_network(net)
+        address = IPAddress(record[prop])
+        if address.version == version and first <= int(address) <= last:
             return record
 
 
 def test_property(record={}, regex='.*', prop=''):
     if prop in record:
-        if re.match(regex, record[prop]):
+        if _compile_regex(regex).match(record[prop]):
             return record
 
 
@@ -18,7 +35,106 @@ class TestModule(object):
     ''' jinja2 filters '''
 
     def tests(self):
-        return {
+        tests = {
             'test_network': test_network,
             'test_property': test_property
         }
+        profile = os.environ.get('NEPHELAIIO_PLUGINS_PROFILE')
+        if profile:
+            fmt = os.environ.get('NEPHELAIIO_PLUGINS_PROFILE_FORMAT', 'json')
+            _profiler.register(profile, fmt)
+            tests = {
+                name: _profiler.wrap(name, fn) for name, fn in tests.items()
+            }
+        return tests
+
+
+def _percentile(ordered, pct):
+    return ordered[max(0, -(-len(ordered) * pct // 100) - 1)]
+
+
+class _Profiler(object):
+    '''
+    Reduced copy of the filter plugin's _Profiler (plugins cannot import
+    each other); reports share its fields, checked by the test suite
+    '''
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.calls = {}
+        self.directory = None
+
+    def wrap(self, name, fn):
+        import array
+        timings, sizes = self.calls.setdefault(name, (array.array('d'), []))
+
+        @functools.wraps(fn)
+        def profiled(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings.append(time.perf_counter() - start)
+                sizes.append(_input_size(args[0]) if args else 0)
+
+        return profiled
+
+    def stats(self):
+        stats = []
+        for name, (timings, sizes) in sorted(self.calls.items()):
+            ordered = sorted(timings)
+            if ordered:
+                stats.append(dict(
+                    plugin=self.plugin, name=name, calls=len(ordered),
+                    total_s=sum(ordered), mean_s=sum(ordered) / len(ordered),
+                    p50_s=_percentile(ordered, 50),
+                    p90_s=_percentile(ordered, 90),
+                    p99_s=_percentile(ordered, 99), max_s=ordered[-1],
+                    input_size_total=sum(sizes), input_size_max=max(sizes),
+                ))
+        return stats
+
+    def register(self, directory, fmt='json'):
+        import atexit
+        import multiprocessing.util
+        if self.directory is None:
+            self.directory, self.fmt = directory, fmt
+            atexit.register(self.report)
+            multiprocessing.util.Finalize(None, self.report, exitpriority=10)
+            multiprocessing.util.register_after_fork(
+                self, _Profiler._after_fork
+            )
+
+    def _after_fork(self):
+        import multiprocessing.util
+        self._reset()
+        multiprocessing.util.Finalize(None, self.report, exitpriority=10)
+
+    def _reset(self):
+        for timings, sizes in self.calls.values():
+            del timings[:], sizes[:]
+
+    def report(self):
+        import csv
+        import json
+        stats = self.stats()
+        if stats:
+            name = '{0}-{1}.{2}'.format(self.plugin, os.getpid(), self.fmt)
+            with open(os.path.join(self.directory, name), 'w') as f:
+                if self.fmt == 'csv':
+                    writer = csv.DictWriter(f, fieldnames=list(stats[0]))
+                    writer.writeheader()
+                    writer.writerows(stats)
+                else:
+                    json.dump(stats, f, indent=2)
+            self._reset()
+
+
+def _input_size(x):
+    try:
+        return len(x)
+    except TypeError:
+        return 1
+
+
+_profiler = _Profiler('tests')